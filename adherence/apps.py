@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_upcoming_partitions(sender, using, **kwargs):
+    from django.db import connections
+    from .partitions import ensure_partitions
+
+    ensure_partitions(using=connections[using])
 
 
 class AdherenceConfig(AppConfig):
     name = 'adherence'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(create_upcoming_partitions, sender=self)
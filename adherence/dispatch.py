@@ -0,0 +1,251 @@
+"""
+In-process reminder dispatcher.
+
+Active reminders are kept in a 1440-slot timing wheel (one slot per minute
+of the day). The dispatcher polls Reminder / MedicineSchedule rows changed
+since its last poll, moves them between slots, and fires each slot once a
+day through the configured backend (settings.REMINDER_BACKEND).
+"""
+import sys
+import time as time_module
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from schedules.models import MedicineSchedule
+from .models import Reminder
+
+MINUTES_PER_DAY = 24 * 60
+
+# Re-read rows changed this long before the last high-water mark, so rows
+# committed late by slow transactions are not skipped.
+POLL_OVERLAP = timedelta(seconds=60)
+
+FIRE_CHUNK_SIZE = 2000
+
+PATIENT_LOOKUP = "schedule__prescription_item__prescription__patient"
+
+
+# ---------------------------
+# BACKENDS
+# ---------------------------
+class ConsoleBackend:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, reminders):
+        for reminder in reminders:
+            self.stream.write(
+                f"[{reminder['time']:%H:%M}] {reminder['username']}: "
+                f"time to take {reminder['medicine']}\n"
+            )
+
+
+class FileBackend:
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, "REMINDER_FILE_PATH", settings.BASE_DIR / "reminders.log")
+
+    def send(self, reminders):
+        with open(self.path, "a", encoding="utf-8") as fh:
+            ConsoleBackend(fh).send(reminders)
+
+
+class EmailBackend:
+    """Sends through Django's EMAIL_BACKEND (e.g. a local SMTP debugging server)."""
+
+    def send(self, reminders):
+        send_mass_mail(
+            (
+                (
+                    "MediTracker reminder",
+                    f"It's {reminder['time']:%H:%M} - time to take {reminder['medicine']}.",
+                    None,
+                    [reminder["email"]],
+                )
+                for reminder in reminders
+                if reminder["email"]
+            ),
+            fail_silently=True,
+        )
+
+
+def get_backend():
+    path = getattr(settings, "REMINDER_BACKEND", "adherence.dispatch.ConsoleBackend")
+    return import_string(path)()
+
+
+# ---------------------------
+# TIMING WHEEL
+# ---------------------------
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+class TimingWheel:
+    """One set of reminder ids per minute of the day, plus a reverse index."""
+
+    def __init__(self):
+        self.slots = [set() for _ in range(MINUTES_PER_DAY)]
+        self.slot_of = {}
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def add(self, reminder_id, minute):
+        current = self.slot_of.get(reminder_id)
+        if current == minute:
+            return
+        if current is not None:
+            self.slots[current].discard(reminder_id)
+        self.slots[minute].add(reminder_id)
+        self.slot_of[reminder_id] = minute
+
+    def remove(self, reminder_id):
+        minute = self.slot_of.pop(reminder_id, None)
+        if minute is not None:
+            self.slots[minute].discard(reminder_id)
+
+    def due(self, minute):
+        return list(self.slots[minute])
+
+
+# ---------------------------
+# DISPATCHER
+# ---------------------------
+class ReminderDispatcher:
+
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+        self.wheel = TimingWheel()
+        self.high_water = None
+        self.last_minute = None
+        self.last_day = None
+
+    def load_changes(self):
+        """
+        Applies Reminder / MedicineSchedule rows changed since the last
+        poll. The first call loads every active reminder; later calls run
+        one query per updated_at index (changed reminders, reminders of
+        changed schedules) rather than an OR across the join.
+        """
+        if self.high_water is None:
+            batches = [Reminder.objects.filter(is_active=True, schedule__is_active=True)]
+        else:
+            since = self.high_water - POLL_OVERLAP
+            batches = [
+                Reminder.objects.filter(updated_at__gt=since),
+                Reminder.objects.filter(
+                    schedule_id__in=MedicineSchedule.objects.filter(updated_at__gt=since).values("id")
+                ),
+            ]
+
+        seen = set()
+        for rows in batches:
+            for reminder_id, reminder_time, is_active, schedule_active, updated, schedule_updated in rows.values_list(
+                "id", "reminder_time", "is_active", "schedule__is_active", "updated_at", "schedule__updated_at"
+            ).iterator(chunk_size=FIRE_CHUNK_SIZE):
+                if reminder_id in seen:
+                    continue
+                seen.add(reminder_id)
+
+                if is_active and schedule_active:
+                    self.wheel.add(reminder_id, minute_of_day(reminder_time))
+                else:
+                    self.wheel.remove(reminder_id)
+
+                latest = max(updated, schedule_updated)
+                if self.high_water is None or latest > self.high_water:
+                    self.high_water = latest
+
+        if self.high_water is None:
+            self.high_water = timezone.now()
+
+        return len(seen)
+
+    def fire_due(self, now=None):
+        """
+        Fires every slot between the last processed minute and `now`. On a
+        day rollover the rest of the previous day is fired first, so a late
+        evening reminder is not lost between two ticks.
+        """
+        now = timezone.localtime(now)
+        today = now.date()
+        current = minute_of_day(now)
+
+        fired = 0
+        if self.last_day is None:
+            start = current
+        elif self.last_day != today:
+            fired += self._fire_range(self.last_day, self.last_minute + 1, MINUTES_PER_DAY - 1)
+            start = 0
+        else:
+            start = self.last_minute + 1
+
+        fired += self._fire_range(today, start, current)
+
+        self.last_day = today
+        self.last_minute = current
+        return fired
+
+    def _fire_range(self, day, first, last):
+        fired = 0
+        for minute in range(first, last + 1):
+            due = self.wheel.due(minute)
+            for offset in range(0, len(due), FIRE_CHUNK_SIZE):
+                fired += self._fire(due[offset:offset + FIRE_CHUNK_SIZE], day)
+        return fired
+
+    def _fire(self, reminder_ids, today):
+        """
+        Re-checks the due reminders against the database (they may have
+        been deleted or their schedule ended) and sends the valid ones.
+        """
+        rows = list(Reminder.objects.filter(
+            id__in=reminder_ids,
+            is_active=True,
+            schedule__is_active=True,
+            schedule__start_date__lte=today,
+        ).filter(
+            Q(schedule__end_date__isnull=True) | Q(schedule__end_date__gte=today),
+            Q(schedule__repeat_daily=True) | Q(schedule__start_date=today),
+        ).values(
+            "id",
+            "reminder_time",
+            "schedule__prescription_item__medicine__name",
+            f"{PATIENT_LOOKUP}__username",
+            f"{PATIENT_LOOKUP}__email",
+        ))
+
+        live = {row["id"] for row in rows}
+        skipped = [reminder_id for reminder_id in reminder_ids if reminder_id not in live]
+        if skipped:
+            remaining = set(Reminder.objects.filter(id__in=skipped).values_list("id", flat=True))
+            for reminder_id in skipped:
+                if reminder_id not in remaining:
+                    self.wheel.remove(reminder_id)
+
+        if rows:
+            self.backend.send([
+                {
+                    "reminder_id": row["id"],
+                    "time": row["reminder_time"],
+                    "medicine": row["schedule__prescription_item__medicine__name"],
+                    "username": row[f"{PATIENT_LOOKUP}__username"],
+                    "email": row[f"{PATIENT_LOOKUP}__email"],
+                }
+                for row in rows
+            ])
+
+        return len(rows)
+
+    def run(self, interval=15, iterations=None):
+        while iterations is None or iterations > 0:
+            self.load_changes()
+            self.fire_due()
+            if iterations is not None:
+                iterations -= 1
+            time_module.sleep(interval)
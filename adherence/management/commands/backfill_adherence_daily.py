@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from adherence.models import IntakeLog
+from adherence.services import rebuild_adherence_daily, rebuild_adherence_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the AdherenceDaily rollup and AdherenceMonth bitmaps from "
+        "IntakeLog, one batch of patients at a time. Re-run with --after to "
+        "resume from the last reported patient id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--after",
+            type=int,
+            default=0,
+            help="Only process patients with an id greater than this.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of patients rebuilt per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        last_id = options["after"]
+        batch_size = options["batch_size"]
+        processed = 0
+
+        while True:
+            patient_ids = list(
+                IntakeLog.objects.filter(patient_id__gt=last_id)
+                .order_by("patient_id")
+                .values_list("patient_id", flat=True)
+                .distinct()[:batch_size]
+            )
+            if not patient_ids:
+                break
+
+            rebuild_adherence_daily(patient_ids)
+            rebuild_adherence_months(patient_ids)
+
+            last_id = patient_ids[-1]
+            processed += len(patient_ids)
+            self.stdout.write(f"Rebuilt {processed} patients (resume with --after {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete: {processed} patients."))
@@ -0,0 +1,47 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from adherence.dispatch import MINUTES_PER_DAY, TimingWheel
+
+
+class Command(BaseCommand):
+    help = "Benchmark the reminder timing wheel with synthetic reminders (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reminders", type=int, default=100_000)
+        parser.add_argument("--changes", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        count = options["reminders"]
+        rng = random.Random(0)
+
+        tracemalloc.start()
+        began = time.perf_counter()
+        wheel = TimingWheel()
+        for reminder_id in range(count):
+            wheel.add(reminder_id, rng.randrange(MINUTES_PER_DAY))
+        load_time = time.perf_counter() - began
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        began = time.perf_counter()
+        for _ in range(options["changes"]):
+            reminder_id = rng.randrange(count)
+            if rng.random() < 0.2:
+                wheel.remove(reminder_id)
+            else:
+                wheel.add(reminder_id, rng.randrange(MINUTES_PER_DAY))
+        change_time = time.perf_counter() - began
+
+        began = time.perf_counter()
+        fired = sum(len(wheel.due(minute)) for minute in range(MINUTES_PER_DAY))
+        day_time = time.perf_counter() - began
+
+        self.stdout.write(
+            f"load {count} reminders: {load_time * 1000:.1f} ms, peak {peak / 2**20:.1f} MiB\n"
+            f"apply {options['changes']} changes: {change_time * 1000:.1f} ms\n"
+            f"scan a full day ({MINUTES_PER_DAY} ticks, {fired} due): {day_time * 1000:.1f} ms"
+        )
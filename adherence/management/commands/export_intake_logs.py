@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from adherence.services import iter_intake_export_rows, parse_export_date, stream_csv, stream_ndjson
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Stream a patient's intake history to a CSV or NDJSON file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("patient", help="Patient username.")
+        parser.add_argument("--start", help="First date (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last date (YYYY-MM-DD).")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+        parser.add_argument("--output", help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            patient_user = User.objects.get(username=options["patient"], role="patient")
+        except User.DoesNotExist:
+            raise CommandError(f"Patient '{options['patient']}' does not exist.")
+
+        try:
+            start_date = parse_export_date(options["start"])
+            end_date = parse_export_date(options["end"])
+        except ValueError:
+            raise CommandError("--start and --end must be valid dates (YYYY-MM-DD).")
+
+        rows = iter_intake_export_rows(patient_user, start_date=start_date, end_date=end_date)
+        chunks = stream_ndjson(rows) if options["format"] == "ndjson" else stream_csv(rows)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as fh:
+                fh.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from adherence.partitions import archive_partitions, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly IntakeLog partitions and, with --retain-months, "
+        "detach and archive partitions older than the retention horizon."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="How many future months should already have a partition.",
+        )
+        parser.add_argument(
+            "--retain-months",
+            type=int,
+            help="Archive partitions that ended more than this many months ago.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default="archive/intake_logs",
+            help="Where archived partitions are written as .csv.gz files.",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("IntakeLog is not partitioned on this database; nothing to do.")
+            return
+
+        for name in ensure_partitions(months_ahead=options["months_ahead"]):
+            self.stdout.write(f"Created partition {name}")
+
+        if options["retain_months"] is not None:
+            for path in archive_partitions(options["retain_months"], options["archive_dir"]):
+                self.stdout.write(f"Archived {path}")
+
+        self.stdout.write(self.style.SUCCESS("Partitions up to date."))
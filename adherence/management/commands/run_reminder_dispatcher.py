@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from adherence.dispatch import ReminderDispatcher
+
+
+class Command(BaseCommand):
+    help = "Run the reminder dispatcher loop (uses settings.REMINDER_BACKEND)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=15,
+            help="Seconds between polls for changes and due reminders.",
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = ReminderDispatcher()
+        loaded = dispatcher.load_changes()
+        self.stdout.write(f"Loaded {loaded} active reminders.")
+        dispatcher.run(interval=options["interval"])
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from adherence.services import sweep_missed_doses
+
+
+class Command(BaseCommand):
+    help = (
+        "Log expected doses with no IntakeLog as missed once they are past "
+        "the grace period. Safe to run repeatedly or from several workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lookback-days",
+            type=int,
+            default=7,
+            help="How many past days to check for unlogged doses.",
+        )
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=120,
+            help="How long after the scheduled time a dose counts as missed.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows per bulk insert.",
+        )
+
+    def handle(self, *args, **options):
+        count = sweep_missed_doses(
+            lookback_days=options["lookback_days"],
+            grace=timedelta(minutes=options["grace_minutes"]),
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Marked {count} doses as missed."))
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_logs(apps, schema_editor):
+    """
+    Stops before adding the constraint if a schedule has several logs for
+    one day. Which one is right is a clinical call, so nothing is deleted
+    here; an operator resolves them and runs migrate again.
+    """
+    IntakeLog = apps.get_model("adherence", "IntakeLog")
+
+    duplicates = IntakeLog.objects.values("schedule_id", "date").annotate(
+        copies=Count("id"),
+    ).filter(copies__gt=1).order_by("schedule_id", "date")
+
+    count = duplicates.count()
+    if count:
+        examples = ", ".join(
+            f"schedule {row['schedule_id']} on {row['date']}" for row in duplicates[:5]
+        )
+        raise RuntimeError(
+            f"{count} (schedule, date) pairs have more than one intake log "
+            f"(e.g. {examples}). Keep one log per schedule and day, then "
+            f"run migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0002_adherencedaily'),
+        ('schedules', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_logs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='intakelog',
+            constraint=models.UniqueConstraint(fields=('schedule', 'date'), name='unique_intake_per_schedule_day'),
+        ),
+    ]
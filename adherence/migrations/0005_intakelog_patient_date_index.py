@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0004_reminder_updated_at'),
+        ('schedules', '0002_medicineschedule_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='intakelog',
+            index=models.Index(fields=['patient', '-date', '-id'], name='intake_patient_date_id_idx'),
+        ),
+    ]
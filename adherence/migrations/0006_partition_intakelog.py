@@ -0,0 +1,112 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:40
+
+from datetime import date
+
+from django.db import migrations
+
+TABLE = "adherence_intakelog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+MONTHS_AHEAD = 3
+
+
+# Frozen copies of the adherence.partitions helpers, so later changes to
+# that module cannot change what this migration does.
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def existing_constraints_and_indexes(cursor):
+    """
+    The table's constraints and standalone indexes as SQL to recreate
+    them, read from the catalog so generated names are kept as they are.
+    """
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f') "
+        "ORDER BY contype DESC, conname",
+        [TABLE],
+    )
+    statements = []
+    for name, kind, definition in cursor.fetchall():
+        if kind == "p":
+            # PostgreSQL requires the partition key in every unique constraint
+            definition = "PRIMARY KEY (id, date)"
+        statements.append(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = %s::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid) "
+        "ORDER BY i.indexrelid",
+        [TABLE],
+    )
+    statements += [row[0] for row in cursor.fetchall()]
+    return statements
+
+
+def partition_intake_logs(apps, schema_editor):
+    """
+    Rebuilds adherence_intakelog as a table range-partitioned by month on
+    `date`. The model state is unchanged: `id` stays unique through its
+    sequence, while the database primary key becomes (id, date) because
+    PostgreSQL requires the partition key in every unique constraint.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(date) FROM {TABLE}")
+        first_day = cursor.fetchone()[0] or date.today()
+        recreate = existing_constraints_and_indexes(cursor)
+
+    old = f"{TABLE}_unpartitioned"
+    statements = [
+        f"ALTER TABLE {TABLE} RENAME TO {old}",
+        f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (date)",
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT",
+    ]
+
+    month = month_start(first_day)
+    last = add_months(month_start(date.today()), MONTHS_AHEAD)
+    while month <= last:
+        statements.append(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+        month = add_months(month, 1)
+
+    statements += [
+        f"INSERT INTO {TABLE} SELECT * FROM {old}",
+        f"DROP TABLE {old}",
+
+        # id keeps its own sequence (identity columns need PostgreSQL 17 on partitioned tables)
+        f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+        f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)",
+        f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')",
+
+        # Same constraint / index names as on the plain table
+        *recreate,
+    ]
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0005_intakelog_patient_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_intake_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0006_partition_intakelog'),
+        ('schedules', '0002_medicineschedule_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdherenceMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('days', models.BigIntegerField(default=0)),
+                ('patient', models.ForeignKey(limit_choices_to={'role': 'patient'}, on_delete=django.db.models.deletion.CASCADE, related_name='adherence_months', to=settings.AUTH_USER_MODEL)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adherence_months', to='schedules.medicineschedule')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'month'], name='adherence_a_patient_3caa41_idx')],
+                'unique_together': {('schedule', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0007_adherencemonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntakeLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(max_length=63)),
+                ('before', models.DateField(help_text='Every archived row is dated before this day')),
+                ('path', models.CharField(max_length=255)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -28,6 +28,17 @@ class IntakeLog(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["schedule", "date"],
+                name="unique_intake_per_schedule_day",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["patient", "-date", "-id"], name="intake_patient_date_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.schedule} - {self.status}"
 
@@ -41,6 +52,102 @@ class Reminder(models.Model):
 
     reminder_time = models.TimeField()
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Reminder for {self.schedule} at {self.reminder_time}"
+
+
+class AdherenceDaily(models.Model):
+    """
+    Per (patient, schedule, date) rollup of IntakeLog counts.
+    Kept in sync by adherence.signals; rebuilt by `backfill_adherence_daily`.
+    """
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="adherence_daily",
+        limit_choices_to={"role": "patient"},
+    )
+
+    schedule = models.ForeignKey(
+        MedicineSchedule,
+        on_delete=models.CASCADE,
+        related_name="adherence_daily",
+    )
+
+    date = models.DateField()
+    taken = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("patient", "schedule", "date")
+        indexes = [
+            models.Index(fields=["patient", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} - {self.schedule} - {self.date}"
+
+
+class AdherenceMonth(models.Model):
+    """
+    Per (schedule, month) adherence bitmap: 2 bits per day of the month
+    (bits 2*(day-1) and up) holding one of the DAY_* codes below.
+    Kept in sync alongside AdherenceDaily.
+    """
+    DAY_NONE = 0
+    DAY_TAKEN = 1
+    DAY_MISSED = 2
+    DAY_SKIPPED = 3
+
+    STATUS_CODES = {
+        "taken": DAY_TAKEN,
+        "missed": DAY_MISSED,
+        "skipped": DAY_SKIPPED,
+    }
+
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="adherence_months",
+        limit_choices_to={"role": "patient"},
+    )
+
+    schedule = models.ForeignKey(
+        MedicineSchedule,
+        on_delete=models.CASCADE,
+        related_name="adherence_months",
+    )
+
+    month = models.DateField(help_text="First day of the month")
+    days = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("schedule", "month")
+        indexes = [
+            models.Index(fields=["patient", "month"]),
+        ]
+
+    def decode(self, length=31):
+        return [(self.days >> (2 * index)) & 3 for index in range(length)]
+
+    def __str__(self):
+        return f"{self.schedule} - {self.month:%Y-%m}"
+
+
+class IntakeLogArchive(models.Model):
+    """
+    One slice of IntakeLog moved out of the database by
+    `manage_intake_partitions --retain-months`: a detached monthly
+    partition, or the old rows of the default partition. Rollups dated
+    before the latest `before` can no longer be rebuilt from IntakeLog.
+    """
+    partition = models.CharField(max_length=63)
+    before = models.DateField(help_text="Every archived row is dated before this day")
+    path = models.CharField(max_length=255)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.partition} (before {self.before:%Y-%m-%d})"
@@ -0,0 +1,190 @@
+"""
+Monthly range partitions for adherence_intakelog (PostgreSQL only).
+
+Migration 0006 turns the table into a table partitioned by `date`, with
+one partition per month plus a default partition. The helpers here keep
+partitions created ahead of time and detach/archive old ones. Every
+archive is recorded as an IntakeLogArchive row. On other databases every
+helper is a no-op.
+"""
+import gzip
+from datetime import date
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from .models import IntakeLogArchive
+
+TABLE = "adherence_intakelog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(using=connection):
+    if using.vendor != "postgresql":
+        return False
+
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(using=connection):
+    """Returns {month_start: partition_name} for the monthly partitions."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    prefix = f"{TABLE}_p"
+    for name in names:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split("_")
+            partitions[date(int(year), int(month), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, month):
+    """
+    Creates the partition for `month`. Rows that landed in the default
+    partition for that month are moved into the new partition.
+    """
+    lower, upper = month, add_months(month, 1)
+    name = partition_name(month)
+
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)",
+        [lower, upper],
+    )
+    has_stray_rows = cursor.fetchone()[0]
+
+    if has_stray_rows:
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [lower, upper],
+    )
+
+    if has_stray_rows:
+        cursor.execute(
+            f"INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s",
+            [lower, upper],
+        )
+        cursor.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s",
+            [lower, upper],
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+
+def ensure_partitions(months_ahead=3, today=None, using=connection):
+    """Creates any missing partitions from this month to `months_ahead` months out."""
+    if not is_partitioned(using):
+        return []
+
+    current = month_start(today or date.today())
+    existing = list_partitions(using)
+
+    created = []
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                create_partition(cursor, month)
+                created.append(partition_name(month))
+    return created
+
+
+def archive_partitions(retain_months, directory, today=None, using=connection):
+    """
+    Detaches every monthly partition that ends before the retention
+    horizon, writes it to <directory>/<partition>.csv.gz and drops it.
+    Rows of the default partition older than the horizon are archived the
+    same way. The rollups keep their history: rebuild_adherence_daily /
+    rebuild_adherence_months only rebuild dates after the latest archive.
+    """
+    if not is_partitioned(using):
+        return []
+
+    horizon = add_months(month_start(today or date.today()), -retain_months)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    archived = []
+    for month, name in sorted(list_partitions(using).items()):
+        if add_months(month, 1) > horizon:
+            continue
+
+        path = directory / f"{name}.csv.gz"
+        with transaction.atomic(using=using.alias), using.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            with gzip.open(path, "wb") as fh:
+                _copy_out(cursor, f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", fh)
+            cursor.execute(f"DROP TABLE {name}")
+            IntakeLogArchive.objects.using(using.alias).create(
+                partition=name, before=add_months(month, 1), path=str(path)
+            )
+        archived.append(path)
+
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date < %s)", [horizon])
+        if cursor.fetchone()[0]:
+            path = directory / f"{DEFAULT_PARTITION}_before_{horizon:%Y_%m}.csv.gz"
+            with gzip.open(path, "wb") as fh:
+                _copy_out(
+                    cursor,
+                    f"COPY (SELECT * FROM {DEFAULT_PARTITION} WHERE date < '{horizon.isoformat()}') "
+                    f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                    fh,
+                )
+            cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE date < %s", [horizon])
+            IntakeLogArchive.objects.using(using.alias).create(
+                partition=DEFAULT_PARTITION, before=horizon, path=str(path)
+            )
+            archived.append(path)
+
+    return archived
+
+
+def archive_horizon(using=connection):
+    """First day whose IntakeLog rows are all still in the database, or None."""
+    return (
+        IntakeLogArchive.objects.using(using.alias)
+        .order_by("-before")
+        .values_list("before", flat=True)
+        .first()
+    )
+
+
+def _copy_out(cursor, sql, fh):
+    raw = cursor.cursor
+    if hasattr(raw, "copy_expert"):  # psycopg2
+        raw.copy_expert(sql, fh)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            for data in copy:
+                fh.write(data)
@@ -1,22 +1,32 @@
+import calendar
+import csv
+import json
+from collections import namedtuple
 from datetime import timedelta
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q, Sum
 from django.utils import timezone
-from .models import IntakeLog
+from django.utils.dateparse import parse_date
+from schedules.models import MedicineSchedule
+from schedules.services import PATIENT_LOOKUP, SCHEDULE_BATCH_SIZE, iter_expected_dose_batches
+from .partitions import archive_horizon
+from .models import IntakeLog, AdherenceDaily, AdherenceMonth
 
-def get_adherence_stats(patient_user, days=7):
-    """
-    Returns adherence stats for a patient for last `days`
-    """
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=days)
+DEFAULT_WINDOWS = (7, 30, 90)
 
-    logs = IntakeLog.objects.filter(
-        patient=patient_user,
-        date__range=(start_date, end_date),
-    )
+# Windows longer than this are read from the AdherenceDaily rollup
+ROLLUP_MIN_DAYS = 30
+
+ROLLUP_FIELDS = ["taken", "missed", "skipped"]
 
-    total = logs.count()
-    taken = logs.filter(status="taken").count()
-    missed = logs.filter(status__in=["missed", "skipped"]).count()
+
+def _build_stats(taken, missed, skipped):
+    """
+    Shapes raw counts into the stats dict used by views/templates.
+    `missed` in the result counts both missed and skipped doses.
+    """
+    total = taken + missed + skipped
 
     if total == 0:
         adherence = None
@@ -26,6 +36,605 @@ def get_adherence_stats(patient_user, days=7):
     return {
         "total": total,
         "taken": taken,
-        "missed": missed,
+        "missed": missed + skipped,
         "adherence": adherence,
-    }
\ No newline at end of file
+    }
+
+
+def _grouped_counts(group_by, start_date, end_date, **filters):
+    """
+    taken/missed/skipped counts grouped by `group_by` over a date range.
+    Long ranges read the daily rollup, short ones the raw IntakeLog rows.
+    """
+    if (end_date - start_date).days > ROLLUP_MIN_DAYS:
+        qs = AdherenceDaily.objects.filter(
+            date__range=(start_date, end_date),
+            **filters
+        ).values(group_by).annotate(
+            taken=Sum("taken"),
+            missed=Sum("missed"),
+            skipped=Sum("skipped"),
+        )
+    else:
+        qs = IntakeLog.objects.filter(
+            date__range=(start_date, end_date),
+            **filters
+        ).values(group_by).annotate(
+            taken=Count("id", filter=Q(status="taken")),
+            missed=Count("id", filter=Q(status="missed")),
+            skipped=Count("id", filter=Q(status="skipped")),
+        )
+
+    return qs.order_by()
+
+
+def get_adherence_overview(patient_user, windows=DEFAULT_WINDOWS, series_days=7):
+    """
+    Returns adherence stats for several trailing windows plus a per-day
+    series, all from a single GROUP BY date query.
+
+    {
+        "windows": {7: {...}, 30: {...}, 90: {...}},
+        "series": [{"date", "taken", "missed", "skipped"}, ...],  # oldest first
+    }
+    """
+    end_date = timezone.now().date()
+    span = max(max(windows, default=0), series_days)
+    start_date = end_date - timedelta(days=span)
+
+    rows = _grouped_counts("date", start_date, end_date, patient=patient_user)
+
+    per_day = {row["date"]: row for row in rows}
+
+    window_stats = {}
+    for days in windows:
+        window_start = end_date - timedelta(days=days)
+        taken = missed = skipped = 0
+        for day, row in per_day.items():
+            if day >= window_start:
+                taken += row["taken"]
+                missed += row["missed"]
+                skipped += row["skipped"]
+        window_stats[days] = _build_stats(taken, missed, skipped)
+
+    series = []
+    for offset in range(series_days - 1, -1, -1):
+        day = end_date - timedelta(days=offset)
+        row = per_day.get(day, {})
+        series.append({
+            "date": day,
+            "taken": row.get("taken", 0),
+            "missed": row.get("missed", 0),
+            "skipped": row.get("skipped", 0),
+        })
+
+    return {
+        "windows": window_stats,
+        "series": series,
+    }
+
+
+def get_adherence_stats(patient_user, days=7):
+    """
+    Returns adherence stats for a patient for last `days`
+    """
+    overview = get_adherence_overview(patient_user, windows=(days,), series_days=0)
+    return overview["windows"][days]
+
+
+def get_adherence_stats_bulk(patient_users, days=7):
+    """
+    Returns {patient_user_id: stats} for many patients from a single
+    GROUP BY patient query. Patients without logs get empty stats.
+    """
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=days)
+
+    patient_ids = [user.pk for user in patient_users]
+
+    rows = _grouped_counts("patient_id", start_date, end_date, patient_id__in=patient_ids)
+
+    stats = {patient_id: _build_stats(0, 0, 0) for patient_id in patient_ids}
+    for row in rows:
+        stats[row["patient_id"]] = _build_stats(row["taken"], row["missed"], row["skipped"])
+
+    return stats
+
+
+# ---------------------------
+# DAILY ROLLUP
+# ---------------------------
+def _lock_rollups(model, placeholders, lookup):
+    """
+    Inserts the missing rollup rows and locks every row matching `lookup`,
+    so concurrent refreshes of the same buckets (a patient's log and the
+    missed-dose sweep, say) recompute one after the other instead of
+    overwriting each other's counts.
+    """
+    model.objects.bulk_create(placeholders, ignore_conflicts=True)
+    list(model.objects.select_for_update().filter(lookup).order_by("pk").values_list("pk", flat=True))
+
+
+def refresh_adherence_daily(keys):
+    """
+    Recomputes AdherenceDaily rows for the given
+    (patient_id, schedule_id, date) keys from IntakeLog.
+    Buckets with no logs left are removed.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+
+    affected = Q()
+    for patient_id, schedule_id, day in keys:
+        affected |= Q(patient_id=patient_id, schedule_id=schedule_id, date=day)
+
+    with transaction.atomic():
+        _lock_rollups(
+            AdherenceDaily,
+            [
+                AdherenceDaily(patient_id=patient_id, schedule_id=schedule_id, date=day)
+                for patient_id, schedule_id, day in sorted(keys)
+            ],
+            affected,
+        )
+
+        rows = IntakeLog.objects.filter(
+            patient_id__in={key[0] for key in keys},
+            schedule_id__in={key[1] for key in keys},
+            date__in={key[2] for key in keys},
+        ).values("patient_id", "schedule_id", "date").annotate(
+            taken=Count("id", filter=Q(status="taken")),
+            missed=Count("id", filter=Q(status="missed")),
+            skipped=Count("id", filter=Q(status="skipped")),
+        ).order_by()
+
+        counts = {
+            (row["patient_id"], row["schedule_id"], row["date"]): row
+            for row in rows
+        }
+
+        upserts = []
+        empty = []
+        for key in keys:
+            row = counts.get(key)
+            if row is None:
+                empty.append(key)
+                continue
+            upserts.append(AdherenceDaily(
+                patient_id=key[0],
+                schedule_id=key[1],
+                date=key[2],
+                taken=row["taken"],
+                missed=row["missed"],
+                skipped=row["skipped"],
+            ))
+
+        if upserts:
+            AdherenceDaily.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["patient", "schedule", "date"],
+                update_fields=ROLLUP_FIELDS,
+            )
+
+        if empty:
+            stale = Q()
+            for patient_id, schedule_id, day in empty:
+                stale |= Q(patient_id=patient_id, schedule_id=schedule_id, date=day)
+            AdherenceDaily.objects.filter(stale).delete()
+
+
+def rebuild_adherence_daily(patient_ids):
+    """
+    Rebuilds the AdherenceDaily rows of the given patients from IntakeLog.
+    Rows before the archive horizon are kept, since their logs are gone.
+    Used by the backfill command; safe to run repeatedly.
+    """
+    logs = IntakeLog.objects.filter(patient_id__in=patient_ids)
+    rollups = AdherenceDaily.objects.filter(patient_id__in=patient_ids)
+
+    since = archive_horizon()
+    if since is not None:
+        logs = logs.filter(date__gte=since)
+        rollups = rollups.filter(date__gte=since)
+
+    rows = logs.values("patient_id", "schedule_id", "date").annotate(
+        taken=Count("id", filter=Q(status="taken")),
+        missed=Count("id", filter=Q(status="missed")),
+        skipped=Count("id", filter=Q(status="skipped")),
+    ).order_by()
+
+    with transaction.atomic():
+        rollups.delete()
+        AdherenceDaily.objects.bulk_create(
+            [
+                AdherenceDaily(
+                    patient_id=row["patient_id"],
+                    schedule_id=row["schedule_id"],
+                    date=row["date"],
+                    taken=row["taken"],
+                    missed=row["missed"],
+                    skipped=row["skipped"],
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+
+
+# ---------------------------
+# MONTHLY BITMAPS
+# ---------------------------
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _encode_months(rows):
+    """
+    Packs (patient_id, schedule_id, date, status) rows into
+    {(schedule_id, month): (patient_id, bits)}.
+    """
+    months = {}
+    for patient_id, schedule_id, day, status in rows:
+        key = (schedule_id, _month_start(day))
+        _, bits = months.get(key, (patient_id, 0))
+        bits |= AdherenceMonth.STATUS_CODES[status] << (2 * (day.day - 1))
+        months[key] = (patient_id, bits)
+    return months
+
+
+def refresh_adherence_months(keys):
+    """
+    Rebuilds the AdherenceMonth bitmaps touched by the given
+    (patient_id, schedule_id, date) keys.
+    """
+    owners = {(key[1], _month_start(key[2])): key[0] for key in keys}
+    month_keys = set(owners)
+    if not month_keys:
+        return
+
+    affected = Q()
+    for schedule_id, month in month_keys:
+        affected |= Q(schedule_id=schedule_id, month=month)
+
+    with transaction.atomic():
+        _lock_rollups(
+            AdherenceMonth,
+            [
+                AdherenceMonth(patient_id=owners[key], schedule_id=key[0], month=key[1])
+                for key in sorted(month_keys)
+            ],
+            affected,
+        )
+
+        first = min(month for _, month in month_keys)
+        last = max(month for _, month in month_keys)
+        last = (last + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+        rows = IntakeLog.objects.filter(
+            schedule_id__in={schedule_id for schedule_id, _ in month_keys},
+            date__range=(first, last),
+        ).values_list("patient_id", "schedule_id", "date", "status")
+
+        months = {
+            key: value for key, value in _encode_months(rows).items()
+            if key in month_keys
+        }
+
+        if months:
+            AdherenceMonth.objects.bulk_create(
+                [
+                    AdherenceMonth(patient_id=patient_id, schedule_id=schedule_id, month=month, days=bits)
+                    for (schedule_id, month), (patient_id, bits) in months.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["schedule", "month"],
+                update_fields=["days"],
+            )
+
+        empty = month_keys - set(months)
+        if empty:
+            stale = Q()
+            for schedule_id, month in empty:
+                stale |= Q(schedule_id=schedule_id, month=month)
+            AdherenceMonth.objects.filter(stale).delete()
+
+
+def rebuild_adherence_months(patient_ids):
+    """
+    Rebuilds the AdherenceMonth bitmaps of the given patients. Months
+    before the archive horizon (always a month start) are kept.
+    """
+    logs = IntakeLog.objects.filter(patient_id__in=patient_ids)
+    bitmaps = AdherenceMonth.objects.filter(patient_id__in=patient_ids)
+
+    since = archive_horizon()
+    if since is not None:
+        logs = logs.filter(date__gte=since)
+        bitmaps = bitmaps.filter(month__gte=since)
+
+    rows = logs.values_list("patient_id", "schedule_id", "date", "status").iterator(chunk_size=5000)
+    months = _encode_months(rows)
+
+    with transaction.atomic():
+        bitmaps.delete()
+        AdherenceMonth.objects.bulk_create(
+            [
+                AdherenceMonth(patient_id=patient_id, schedule_id=schedule_id, month=month, days=bits)
+                for (schedule_id, month), (patient_id, bits) in months.items()
+            ],
+            batch_size=1000,
+        )
+
+
+def refresh_rollups(keys):
+    """Refreshes every derived table for the given (patient_id, schedule_id, date) keys."""
+    keys = set(keys)
+    refresh_adherence_daily(keys)
+    refresh_adherence_months(keys)
+
+
+def get_adherence_heatmap(patient_user, year):
+    """
+    Decodes a patient's bitmaps for `year` in bulk:
+    [{"schedule_id", "medicine", "time", "months": {1: [code per day], ...}}]
+    """
+    bitmaps = AdherenceMonth.objects.filter(
+        patient=patient_user,
+        month__year=year,
+    ).select_related("schedule__prescription_item__medicine").order_by("schedule_id", "month")
+
+    heatmap = {}
+    for bitmap in bitmaps:
+        schedule = bitmap.schedule
+        entry = heatmap.setdefault(schedule.id, {
+            "schedule_id": schedule.id,
+            "medicine": schedule.prescription_item.medicine.name,
+            "time": schedule.time.strftime("%H:%M"),
+            "months": {},
+        })
+        length = calendar.monthrange(year, bitmap.month.month)[1]
+        entry["months"][bitmap.month.month] = bitmap.decode(length)
+
+    return list(heatmap.values())
+
+# ---------------------------
+# TODAY'S DOSES
+# ---------------------------
+TodayDose = namedtuple(
+    "TodayDose", ["schedule_id", "patient_id", "time", "medicine", "dose", "unit", "status"]
+)
+
+
+def get_today_doses(patient_users, day=None):
+    """
+    Expected doses on `day` (default: today) for many patients, each with
+    the status of its IntakeLog ("" when not logged yet).
+
+    For a single day the schedule expansion reduces to a filter, so the
+    doses and their logs come from one query, left-joined on the
+    (schedule, date) unique index. Returns {patient_id: [TodayDose]},
+    ordered by time.
+    """
+    day = day or timezone.localdate()
+
+    rows = MedicineSchedule.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=day),
+        Q(repeat_daily=True) | Q(start_date=day),
+        is_active=True,
+        start_date__lte=day,
+        **{f"{PATIENT_LOOKUP}__in": patient_users},
+    ).annotate(
+        day_log=FilteredRelation("intake_logs", condition=Q(intake_logs__date=day)),
+    ).values_list(
+        "id",
+        f"{PATIENT_LOOKUP}_id",
+        "time",
+        "prescription_item__medicine__name",
+        "prescription_item__dose",
+        "prescription_item__unit",
+        "day_log__status",
+    ).order_by("time", "id")
+
+    doses = {}
+    for row in rows:
+        dose = TodayDose(*row[:-1], row[-1] or "")
+        doses.setdefault(dose.patient_id, []).append(dose)
+    return doses
+
+
+# ---------------------------
+# BULK LOGGING
+# ---------------------------
+def log_doses(patient_user, day, statuses):
+    """
+    Records many doses for one day in a single transaction.
+    `statuses` maps schedule_id -> "taken" / "missed" / "skipped".
+
+    New doses are bulk-inserted and changed ones bulk-updated; doses whose
+    status is unchanged are left alone, so re-submitting is a no-op.
+    Returns {"created": n, "updated": n}.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {
+            log.schedule_id: log
+            for log in IntakeLog.objects.select_for_update().filter(
+                patient=patient_user,
+                date=day,
+                schedule_id__in=list(statuses),
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for schedule_id, status in statuses.items():
+            taken_at = now if status == "taken" else None
+            log = existing.get(schedule_id)
+
+            if log is None:
+                to_create.append(IntakeLog(
+                    schedule_id=schedule_id,
+                    patient=patient_user,
+                    date=day,
+                    status=status,
+                    taken_at=taken_at,
+                ))
+            elif log.status != status:
+                log.status = status
+                log.taken_at = taken_at
+                to_update.append(log)
+
+        IntakeLog.objects.bulk_create(to_create, ignore_conflicts=True)
+        IntakeLog.objects.bulk_update(to_update, ["status", "taken_at"])
+
+        refresh_rollups(
+            [(patient_user.pk, log.schedule_id, day) for log in to_create + to_update]
+        )
+
+    return {"created": len(to_create), "updated": len(to_update)}
+
+
+# ---------------------------
+# MISSED-DOSE SWEEP
+# ---------------------------
+def sweep_missed_doses(lookback_days=7, grace=timedelta(hours=2), chunk_size=1000, now=None,
+                       batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Inserts a "missed" IntakeLog for every expected dose in the last
+    `lookback_days` that is more than `grace` overdue and has no log yet.
+
+    Schedules are walked `batch_size` at a time; each batch is filtered
+    against the cutoff and its existing logs with NumPy, so memory stays
+    bounded by the batch rather than by the number of schedules.
+
+    Relies on the (schedule, date) unique constraint: inserts use
+    ignore_conflicts, so reruns, concurrent sweeps and patients logging
+    at the same moment never produce duplicates. Returns the number of
+    doses that were found without a log.
+    """
+    cutoff = timezone.localtime(now) - grace
+    cutoff = cutoff.replace(tzinfo=None)
+    start_date = cutoff.date() - timedelta(days=lookback_days)
+    first_day = np.datetime64(start_date, "D")
+    days = lookback_days + 1
+
+    found = 0
+    for batch in iter_expected_dose_batches(start_date, cutoff.date(), batch_size=batch_size):
+        due = batch.moments <= np.datetime64(cutoff, "s")
+        schedule_ids = batch.schedule_ids[due]
+        if not len(schedule_ids):
+            continue
+
+        # One int per (schedule, day) so doses and logs compare with np.isin
+        keys = schedule_ids * days + (batch.dates[due] - first_day).astype(np.int64)
+        logged = np.fromiter(
+            (
+                schedule_id * days + (day - start_date).days
+                for schedule_id, day in IntakeLog.objects.filter(
+                    schedule_id__gte=int(schedule_ids.min()),
+                    schedule_id__lte=int(schedule_ids.max()),
+                    date__range=(start_date, cutoff.date()),
+                ).values_list("schedule_id", "date").iterator(chunk_size=chunk_size)
+            ),
+            dtype=np.int64,
+        )
+        missing = ~np.isin(keys, logged)
+
+        doses = list(zip(
+            schedule_ids[missing].tolist(),
+            batch.patient_ids[due][missing].tolist(),
+            batch.dates[due][missing].tolist(),
+        ))
+        found += len(doses)
+
+        for offset in range(0, len(doses), chunk_size):
+            chunk = doses[offset:offset + chunk_size]
+            IntakeLog.objects.bulk_create(
+                [
+                    IntakeLog(
+                        schedule_id=schedule_id,
+                        patient_id=patient_id,
+                        date=day,
+                        status="missed",
+                    )
+                    for schedule_id, patient_id, day in chunk
+                ],
+                ignore_conflicts=True,
+            )
+            refresh_rollups(
+                [(patient_id, schedule_id, day) for schedule_id, patient_id, day in chunk]
+            )
+
+    return found
+
+
+# ---------------------------
+# EXPORT
+# ---------------------------
+EXPORT_FIELDS = ["date", "time", "medicine", "strength", "status", "taken_at"]
+
+
+def parse_export_date(value):
+    """
+    Parses an optional YYYY-MM-DD export bound: None when empty, ValueError
+    when malformed or impossible, so a typo never exports the full history.
+    """
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value!r}")
+    return parsed
+
+
+def iter_intake_export_rows(patient_user, start_date=None, end_date=None, chunk_size=2000):
+    """
+    Yields one dict per IntakeLog (oldest first) using a server-side
+    cursor, so memory stays flat however long the history is.
+    """
+    logs = IntakeLog.objects.filter(patient=patient_user)
+    if start_date:
+        logs = logs.filter(date__gte=start_date)
+    if end_date:
+        logs = logs.filter(date__lte=end_date)
+
+    rows = logs.order_by("date", "id").values_list(
+        "date",
+        "schedule__time",
+        "schedule__prescription_item__medicine__name",
+        "schedule__prescription_item__medicine__strength",
+        "status",
+        "taken_at",
+    ).iterator(chunk_size=chunk_size)
+
+    for day, dose_time, medicine, strength, status, taken_at in rows:
+        yield {
+            "date": day.isoformat(),
+            "time": dose_time.strftime("%H:%M"),
+            "medicine": medicine,
+            "strength": strength,
+            "status": status,
+            "taken_at": taken_at.isoformat() if taken_at else "",
+        }
+
+
+class _Echo:
+    """File-like object whose write() just returns the line (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
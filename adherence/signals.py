@@ -0,0 +1,41 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import IntakeLog
+from .services import refresh_rollups
+
+
+def _rollup_key(log):
+    return (log.patient_id, log.schedule_id, log.date)
+
+
+@receiver(pre_save, sender=IntakeLog)
+def remember_previous_rollup_key(sender, instance, raw=False, **kwargs):
+    """Remember the bucket an edited log used to count towards."""
+    instance._previous_rollup_key = None
+
+    if raw or instance.pk is None:
+        return
+
+    previous = IntakeLog.objects.filter(pk=instance.pk).values_list(
+        "patient_id", "schedule_id", "date"
+    ).first()
+    instance._previous_rollup_key = previous
+
+
+@receiver(post_save, sender=IntakeLog)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    keys = {_rollup_key(instance)}
+    previous = getattr(instance, "_previous_rollup_key", None)
+    if previous:
+        keys.add(previous)
+
+    refresh_rollups(keys)
+
+
+@receiver(post_delete, sender=IntakeLog)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    refresh_rollups([_rollup_key(instance)])
@@ -1,3 +1,585 @@
+import gzip
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from medicines.models import Medicine, Prescription, PrescriptionItem
+from schedules.models import MedicineSchedule
+from .dispatch import ReminderDispatcher
+from .models import IntakeLog, IntakeLogArchive, AdherenceDaily, AdherenceMonth, Reminder
+from .partitions import archive_horizon, archive_partitions, create_partition
+from .services import (
+    get_adherence_overview,
+    get_adherence_stats,
+    get_adherence_stats_bulk,
+    get_today_doses,
+    sweep_missed_doses,
+)
+from schedules.services import get_expected_doses
+
+User = get_user_model()
+
+
+def create_patient_item(username="pat", medicine="Metformin", strength="500mg", **fields):
+    """A patient with one prescription item, by default one dose once a day."""
+    patient = User.objects.create_user(username=username, password="x", role="patient")
+    item = PrescriptionItem.objects.create(
+        prescription=Prescription.objects.create(patient=patient),
+        medicine=Medicine.objects.create(name=medicine, strength=strength),
+        **{"dose": "1", "frequency": "OD", **fields}
+    )
+    return patient, item
+
+
+class AdherenceServicesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item()
+        cls.schedule = MedicineSchedule.objects.create(
+            prescription_item=item,
+            start_date=timezone.now().date() - timedelta(days=120),
+            time=time(8, 0),
+        )
+
+        today = timezone.now().date()
+        for offset, status in [
+            (0, "taken"),
+            (1, "taken"),
+            (2, "missed"),
+            (10, "skipped"),
+            (40, "taken"),
+            (200, "missed"),
+        ]:
+            IntakeLog.objects.create(
+                schedule=cls.schedule,
+                patient=cls.patient,
+                date=today - timedelta(days=offset),
+                status=status,
+            )
+
+    def test_overview_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            overview = get_adherence_overview(self.patient)
+
+        self.assertEqual(overview["windows"][7], {
+            "total": 3, "taken": 2, "missed": 1, "adherence": 66.7,
+        })
+        self.assertEqual(overview["windows"][30]["total"], 4)
+        self.assertEqual(overview["windows"][90]["total"], 5)
+
+        series = overview["series"]
+        self.assertEqual(len(series), 7)
+        self.assertEqual(series[-1]["date"], timezone.now().date())
+        self.assertEqual(series[-1]["taken"], 1)
+        self.assertEqual(series[-3]["missed"], 1)
+
+    def test_stats_wrapper_matches_window(self):
+        with self.assertNumQueries(1):
+            stats = get_adherence_stats(self.patient, days=30)
+
+        self.assertEqual(stats, {
+            "total": 4, "taken": 2, "missed": 2, "adherence": 50.0,
+        })
+
+    def test_stats_without_logs(self):
+        other = User.objects.create_user(username="other", password="x", role="patient")
+        self.assertEqual(get_adherence_stats(other), {
+            "total": 0, "taken": 0, "missed": 0, "adherence": None,
+        })
+
+    def test_bulk_stats_single_query(self):
+        other = User.objects.create_user(username="other", password="x", role="patient")
+
+        with self.assertNumQueries(1):
+            stats = get_adherence_stats_bulk([self.patient, other], days=7)
+
+        self.assertEqual(stats[self.patient.pk], get_adherence_stats(self.patient, days=7))
+        self.assertEqual(stats[other.pk]["total"], 0)
+        self.assertIsNone(stats[other.pk]["adherence"])
+
+
+class AdherenceDailyRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Amlodipine", strength="5mg")
+        cls.schedule = MedicineSchedule.objects.create(
+            prescription_item=item,
+            start_date=timezone.now().date() - timedelta(days=30),
+            time=time(9, 0),
+        )
+        cls.today = timezone.now().date()
+
+    def rollup(self, day):
+        return AdherenceDaily.objects.filter(
+            patient=self.patient, schedule=self.schedule, date=day
+        ).values("taken", "missed", "skipped").first()
+
+    def test_rollup_follows_create_update_delete(self):
+        log = IntakeLog.objects.create(
+            schedule=self.schedule, patient=self.patient, date=self.today, status="taken"
+        )
+        self.assertEqual(self.rollup(self.today), {"taken": 1, "missed": 0, "skipped": 0})
+
+        yesterday = self.today - timedelta(days=1)
+        log.status = "missed"
+        log.date = yesterday
+        log.save()
+        self.assertIsNone(self.rollup(self.today))
+        self.assertEqual(self.rollup(yesterday), {"taken": 0, "missed": 1, "skipped": 0})
+
+        log.delete()
+        self.assertFalse(AdherenceDaily.objects.exists())
+
+    def test_refresh_locks_the_rollup_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            IntakeLog.objects.create(
+                schedule=self.schedule, patient=self.patient, date=self.today, status="taken"
+            )
+
+        if connection.features.has_select_for_update:
+            locks = [query["sql"] for query in queries.captured_queries if "FOR UPDATE" in query["sql"]]
+            self.assertEqual(len(locks), 2)
+        self.assertEqual(self.rollup(self.today), {"taken": 1, "missed": 0, "skipped": 0})
+        self.assertEqual(AdherenceMonth.objects.get().days, AdherenceMonth.DAY_TAKEN << 2 * (self.today.day - 1))
+
+    def test_backfill_rebuilds_rollup(self):
+        for offset in range(5):
+            IntakeLog.objects.create(
+                schedule=self.schedule,
+                patient=self.patient,
+                date=self.today - timedelta(days=offset),
+                status="taken",
+            )
+        AdherenceDaily.objects.all().delete()
+
+        call_command("backfill_adherence_daily", stdout=StringIO())
+
+        self.assertEqual(AdherenceDaily.objects.count(), 5)
+        self.assertEqual(get_adherence_stats(self.patient, days=90)["taken"], 5)
+
+
+class MissedDoseSweepTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Losartan", strength="50mg")
+        cls.now = timezone.make_aware(datetime(2026, 3, 10, 12, 0))
+        cls.morning = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 3, 8).date(), time=time(8, 0)
+        )
+        cls.evening = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 3, 8).date(), time=time(20, 0)
+        )
+
+    def test_sweep_is_idempotent_and_keeps_existing_logs(self):
+        IntakeLog.objects.create(
+            schedule=self.morning,
+            patient=self.patient,
+            date=datetime(2026, 3, 9).date(),
+            status="taken",
+        )
+
+        found = sweep_missed_doses(lookback_days=7, grace=timedelta(hours=2), now=self.now)
+
+        # morning: 8th and 10th (9th was taken); evening: 8th and 9th
+        self.assertEqual(found, 4)
+        self.assertEqual(IntakeLog.objects.filter(status="missed").count(), 4)
+        self.assertEqual(IntakeLog.objects.filter(status="taken").count(), 1)
+        self.assertEqual(AdherenceDaily.objects.count(), 5)
+
+        self.assertEqual(sweep_missed_doses(lookback_days=7, now=self.now), 0)
+        self.assertEqual(IntakeLog.objects.count(), 5)
+
+    def test_sweep_in_single_schedule_batches(self):
+        IntakeLog.objects.create(
+            schedule=self.evening,
+            patient=self.patient,
+            date=datetime(2026, 3, 8).date(),
+            status="skipped",
+        )
+
+        found = sweep_missed_doses(lookback_days=7, now=self.now, batch_size=1)
+
+        self.assertEqual(found, 4)
+        self.assertEqual(
+            sorted(IntakeLog.objects.filter(status="missed").values_list("schedule_id", "date__day")),
+            [(self.morning.pk, 8), (self.morning.pk, 9), (self.morning.pk, 10), (self.evening.pk, 9)],
+        )
+
+
+class IntakeTodayViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Levothyroxine", strength="50mcg", frequency="BD")
+        today = timezone.localdate()
+        cls.morning = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=today, time=time(8, 0)
+        )
+        cls.evening = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=today, time=time(20, 0)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.patient)
+
+    def test_lists_todays_doses(self):
+        response = self.client.get(reverse("adherence:intake_today"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row.schedule_id for row in response.context["rows"]],
+            [self.morning.id, self.evening.id],
+        )
+
+    def test_bulk_post_is_idempotent(self):
+        data = {
+            f"status_{self.morning.id}": "taken",
+            f"status_{self.evening.id}": "skipped",
+        }
+        self.client.post(reverse("adherence:intake_today"), data)
+        self.client.post(reverse("adherence:intake_today"), data)
+
+        self.assertEqual(IntakeLog.objects.count(), 2)
+        self.assertEqual(
+            IntakeLog.objects.get(schedule=self.morning).status, "taken"
+        )
+
+        data[f"status_{self.evening.id}"] = "taken"
+        self.client.post(reverse("adherence:intake_today"), data)
+        self.assertEqual(IntakeLog.objects.filter(status="taken").count(), 2)
+        self.assertEqual(
+            AdherenceDaily.objects.get(schedule=self.evening).taken, 1
+        )
+
+
+class TodayDosesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = datetime(2026, 3, 10).date()
+        cls.patients = []
+        for name in ("a", "b"):
+            patient, item = create_patient_item(name, unit="tablet", frequency="BD")
+            schedules = [
+                # due: daily, open-ended / ending today / one-off today
+                (cls.day - timedelta(days=5), None, True, True),
+                (cls.day - timedelta(days=5), cls.day, True, True),
+                (cls.day, None, False, True),
+                # not due: ended, not started, one-off earlier, inactive
+                (cls.day - timedelta(days=5), cls.day - timedelta(days=1), True, True),
+                (cls.day + timedelta(days=1), None, True, True),
+                (cls.day - timedelta(days=1), None, False, True),
+                (cls.day - timedelta(days=5), None, True, False),
+            ]
+            for hour, (start, end, repeat, active) in enumerate(schedules, start=6):
+                MedicineSchedule.objects.create(
+                    prescription_item=item,
+                    start_date=start,
+                    end_date=end,
+                    repeat_daily=repeat,
+                    is_active=active,
+                    time=time(hour, 0),
+                )
+            cls.patients.append(patient)
+
+        first = MedicineSchedule.objects.filter(
+            prescription_item__prescription__patient=cls.patients[0]
+        ).order_by("time").first()
+        IntakeLog.objects.create(schedule=first, patient=cls.patients[0], date=cls.day, status="taken")
+        IntakeLog.objects.create(
+            schedule=first, patient=cls.patients[0], date=cls.day - timedelta(days=1), status="missed"
+        )
+
+    def test_matches_expected_doses_in_one_query(self):
+        with self.assertNumQueries(1):
+            doses = get_today_doses([p.pk for p in self.patients], self.day)
+
+        expected = get_expected_doses(self.day, self.day, self.patients)
+        self.assertEqual(
+            sorted((d.schedule_id, d.patient_id) for rows in doses.values() for d in rows),
+            sorted((d.schedule_id, d.patient_id) for d in expected),
+        )
+
+        first, second = self.patients
+        self.assertEqual([d.status for d in doses[first.pk]], ["taken", "", ""])
+        self.assertEqual([d.status for d in doses[second.pk]], ["", "", ""])
+        self.assertEqual(doses[first.pk][0].medicine, "Metformin")
+        self.assertEqual(doses[first.pk][0].unit, "tablet")
+
+
+class CollectingBackend:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminders):
+        self.sent.extend(reminder["reminder_id"] for reminder in reminders)
+
+
+class ReminderDispatcherTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Insulin", strength="", dose="10", unit="IU")
+        cls.schedule = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 3, 1).date(), time=time(8, 0)
+        )
+
+    def test_fires_due_reminders_and_follows_changes(self):
+        reminder = Reminder.objects.create(schedule=self.schedule, reminder_time=time(7, 45))
+        backend = CollectingBackend()
+        dispatcher = ReminderDispatcher(backend=backend)
+        dispatcher.load_changes()
+
+        dispatcher.fire_due(timezone.make_aware(datetime(2026, 3, 10, 7, 40)))
+        self.assertEqual(backend.sent, [])
+
+        dispatcher.fire_due(timezone.make_aware(datetime(2026, 3, 10, 7, 50)))
+        self.assertEqual(backend.sent, [reminder.id])
+
+        reminder.reminder_time = time(9, 0)
+        reminder.save()
+        dispatcher.load_changes()
+        self.assertEqual(dispatcher.wheel.slot_of[reminder.id], 9 * 60)
+
+        self.schedule.is_active = False
+        self.schedule.save()
+        dispatcher.load_changes()
+        self.assertEqual(len(dispatcher.wheel), 0)
+
+    def test_poll_uses_one_indexed_query_per_table(self):
+        Reminder.objects.create(schedule=self.schedule, reminder_time=time(7, 45))
+        dispatcher = ReminderDispatcher(backend=CollectingBackend())
+        dispatcher.load_changes()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dispatcher.load_changes(), 1)
+
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertFalse(any(" OR " in query["sql"] for query in queries.captured_queries))
+
+    def test_day_rollover_fires_rest_of_previous_day(self):
+        late = Reminder.objects.create(schedule=self.schedule, reminder_time=time(23, 59))
+        early = Reminder.objects.create(schedule=self.schedule, reminder_time=time(0, 0))
+        backend = CollectingBackend()
+        dispatcher = ReminderDispatcher(backend=backend)
+        dispatcher.load_changes()
+
+        dispatcher.fire_due(timezone.make_aware(datetime(2026, 3, 10, 23, 58)))
+        self.assertEqual(backend.sent, [])
+
+        fired = dispatcher.fire_due(timezone.make_aware(datetime(2026, 3, 11, 0, 1)))
+        self.assertEqual(fired, 2)
+        self.assertEqual(backend.sent, [late.id, early.id])
+
+
+class IntakeListViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Warfarin", strength="5mg")
+        schedule = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 3, 1).date(), time=time(8, 0)
+        )
+        for day, status in [(1, "taken"), (2, "missed"), (3, "taken")]:
+            IntakeLog.objects.create(
+                schedule=schedule,
+                patient=cls.patient,
+                date=datetime(2026, 3, day).date(),
+                status=status,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.patient)
+
+    @mock.patch("adherence.views.INTAKE_PAGE_SIZE", 2)
+    def test_keyset_pages_and_summary(self):
+        response = self.client.get(reverse("adherence:intake_list"))
+        self.assertEqual([log.date.day for log in response.context["logs"]], [3, 2])
+        self.assertEqual(response.context["total_logs"], 3)
+        self.assertEqual(response.context["taken_count"], 2)
+        self.assertEqual(response.context["missed_count"], 1)
+
+        cursor = response.context["next_cursor"]
+        response = self.client.get(reverse("adherence:intake_list"), {"after": cursor})
+        self.assertEqual([log.date.day for log in response.context["logs"]], [1])
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class IntakeExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Metoprolol", strength="25mg")
+        schedule = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 3, 1).date(), time=time(8, 0)
+        )
+        for day in (1, 2, 3):
+            IntakeLog.objects.create(
+                schedule=schedule,
+                patient=cls.patient,
+                date=datetime(2026, 3, day).date(),
+                status="taken",
+            )
+
+    def test_csv_export_streams_date_range(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(
+            reverse("adherence:intake_export", args=[self.patient.pk]),
+            {"start": "2026-03-02"},
+        )
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "date,time,medicine,strength,status,taken_at")
+        self.assertEqual(lines[1], "2026-03-02,08:00,Metoprolol,25mg,taken,")
+        self.assertEqual(len(lines), 3)
+
+    def test_other_patients_are_forbidden(self):
+        other = User.objects.create_user(username="other", password="x", role="patient")
+        self.client.force_login(other)
+        response = self.client.get(reverse("adherence:intake_export", args=[self.patient.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_dates_are_rejected(self):
+        self.client.force_login(self.patient)
+        for value in ("2030-02-30", "2024/01/01", "abc"):
+            response = self.client.get(
+                reverse("adherence:intake_export", args=[self.patient.pk]),
+                {"start": value},
+            )
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_command_rejects_malformed_dates(self):
+        with self.assertRaises(CommandError):
+            call_command("export_intake_logs", "pat", "--end", "2026/03/01", stdout=StringIO())
+
+    def test_command_writes_through_command_stdout(self):
+        out = StringIO()
+        call_command("export_intake_logs", "pat", "--end", "2026-03-01", stdout=out)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "date,time,medicine,strength,status,taken_at",
+                "2026-03-01,08:00,Metoprolol,25mg,taken,",
+            ],
+        )
+
+
+class AdherenceHeatmapTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Aspirin", strength="75mg")
+        cls.schedule = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=datetime(2026, 1, 1).date(), time=time(8, 0)
+        )
+
+    def log(self, day, status):
+        return IntakeLog.objects.create(
+            schedule=self.schedule, patient=self.patient, date=day, status=status
+        )
+
+    def test_bitmap_tracks_logs(self):
+        first = self.log(datetime(2026, 1, 1).date(), "taken")
+        self.log(datetime(2026, 1, 31).date(), "skipped")
+        self.log(datetime(2026, 2, 2).date(), "missed")
+
+        january = AdherenceMonth.objects.get(month=datetime(2026, 1, 1).date())
+        self.assertEqual(january.days, 1 | (3 << 60))
+
+        first.delete()
+        january.refresh_from_db()
+        self.assertEqual(january.decode()[0], AdherenceMonth.DAY_NONE)
+
+    def test_heatmap_api_decodes_year(self):
+        self.log(datetime(2026, 2, 2).date(), "missed")
+        self.client.force_login(self.patient)
+
+        response = self.client.get(
+            reverse("adherence:heatmap", args=[self.patient.pk]), {"year": 2026}
+        )
+
+        schedules = response.json()["schedules"]
+        self.assertEqual(len(schedules), 1)
+        february = schedules[0]["months"]["2"]
+        self.assertEqual(len(february), 28)
+        self.assertEqual(february[1], AdherenceMonth.DAY_MISSED)
+        self.assertEqual(sum(february), AdherenceMonth.DAY_MISSED)
+
+    def test_heatmap_rejects_out_of_range_year(self):
+        self.client.force_login(self.patient)
+        url = reverse("adherence:heatmap", args=[self.patient.pk])
+
+        self.assertEqual(self.client.get(url, {"year": 10000}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"year": 0}).status_code, 400)
+
+
+class IntakeArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient, item = create_patient_item(medicine="Atorvastatin", strength="10mg")
+        cls.schedule = MedicineSchedule.objects.create(
+            prescription_item=item, start_date=date(2020, 1, 1), time=time(8, 0)
+        )
+
+    def log(self, day, status="taken"):
+        return IntakeLog.objects.create(
+            schedule=self.schedule, patient=self.patient, date=day, status=status
+        )
+
+    def test_backfill_keeps_rollups_before_archive_horizon(self):
+        for day in (date(2020, 1, 5), date(2020, 3, 5), date(2020, 7, 5)):
+            self.log(day)
+
+        # What archiving does: the old logs leave the table, no signals fire
+        IntakeLog.objects.filter(date__lt=date(2020, 6, 1))._raw_delete(IntakeLog.objects.db)
+        IntakeLogArchive.objects.create(partition="p", before=date(2020, 6, 1), path="p.csv.gz")
+
+        AdherenceDaily.objects.filter(date=date(2020, 7, 5)).delete()
+        call_command("backfill_adherence_daily", stdout=StringIO())
+
+        self.assertEqual(
+            sorted(AdherenceDaily.objects.values_list("date", flat=True)),
+            [date(2020, 1, 5), date(2020, 3, 5), date(2020, 7, 5)],
+        )
+        self.assertEqual(
+            sorted(AdherenceMonth.objects.values_list("month", flat=True)),
+            [date(2020, 1, 1), date(2020, 3, 1), date(2020, 7, 1)],
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "IntakeLog is only partitioned on PostgreSQL")
+    def test_archive_covers_monthly_and_default_partitions(self):
+        with connection.cursor() as cursor:
+            create_partition(cursor, date(2020, 3, 1))
+        self.log(date(2020, 1, 5))   # no partition: default
+        self.log(date(2020, 3, 5))   # 2020-03 partition
+        self.log(date(2020, 7, 5))   # default, after the horizon
+
+        # Run the deferred FK checks now; in production the rows are long committed
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        with tempfile.TemporaryDirectory() as directory:
+            archived = archive_partitions(6, directory, today=date(2020, 12, 1))
+
+            self.assertEqual(
+                [path.name for path in archived],
+                ["adherence_intakelog_p2020_03.csv.gz", "adherence_intakelog_default_before_2020_06.csv.gz"],
+            )
+            for path in archived:
+                with gzip.open(path, "rt") as fh:
+                    self.assertEqual(len(fh.read().splitlines()), 2)
 
-# Create your tests here.
+        self.assertEqual(list(IntakeLog.objects.values_list("date", flat=True)), [date(2020, 7, 5)])
+        self.assertEqual(archive_horizon(), date(2020, 6, 1))
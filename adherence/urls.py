@@ -7,8 +7,11 @@ urlpatterns = [
     # intake logs
     path("intake/", views.intake_list, name="intake_list"),
     path("intake/create/", views.intake_create, name="intake_create"),
+    path("intake/today/", views.intake_today, name="intake_today"),
     path("intake/<int:pk>/edit/", views.intake_update, name="intake_edit"),
     path("intake/<int:pk>/delete/", views.intake_delete, name="intake_delete"),
+    path("intake/export/<int:patient_id>/", views.intake_export, name="intake_export"),
+    path("heatmap/<int:patient_id>/", views.adherence_heatmap, name="heatmap"),
 
     # reminders
     path("reminders/", views.reminder_list, name="reminder_list"),
@@ -1,33 +1,92 @@
+from datetime import date
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Q
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
 from core.decorators import role_required
-from .models import IntakeLog, Reminder
+from appointments.models import Appointment
+from family.utils import can_family_access_patient
+from patients.models import PatientProfile
+from .models import IntakeLog, Reminder, AdherenceMonth
 from .forms import IntakeLogForm, ReminderForm
+from .services import (
+    get_adherence_heatmap,
+    get_today_doses,
+    iter_intake_export_rows,
+    log_doses,
+    parse_export_date,
+    stream_csv,
+    stream_ndjson,
+)
+
+User = get_user_model()
 
 PATIENT_SCHEDULE_LOOKUP = "schedule__prescription_item__prescription__patient"
 
+INTAKE_PAGE_SIZE = 50
+
 
 # ---------------------------
 # INTAKE LOGS (patient)
 # ---------------------------
 @role_required("patient")
 def intake_list(request):
-    logs = IntakeLog.objects.filter(patient=request.user).select_related("schedule").order_by("-id")
-    
-    # Calculate stats
-    total_logs = logs.count()
-    taken_count = logs.filter(status='taken').count()
-    missed_count = logs.filter(status='missed').count()
-    skipped_count = logs.filter(status='skipped').count()
-    
+    logs = IntakeLog.objects.filter(
+        patient=request.user
+    ).select_related(
+        "schedule__prescription_item__medicine"
+    ).order_by("-date", "-id")
+
+    # Keyset pagination on (date, id): ?after=<date>_<id> of the last row shown
+    cursor = parse_intake_cursor(request.GET.get("after"))
+    if cursor:
+        cursor_date, cursor_id = cursor
+        logs = logs.filter(
+            Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id)
+        )
+
+    page = list(logs[:INTAKE_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > INTAKE_PAGE_SIZE:
+        page = page[:INTAKE_PAGE_SIZE]
+        next_cursor = f"{page[-1].date.isoformat()}_{page[-1].id}"
+
+    # Summary cards from one conditional aggregate
+    counts = IntakeLog.objects.filter(patient=request.user).aggregate(
+        total=Count("id"),
+        taken=Count("id", filter=Q(status="taken")),
+        missed=Count("id", filter=Q(status="missed")),
+        skipped=Count("id", filter=Q(status="skipped")),
+    )
+
     return render(request, "adherence/intake_list.html", {
-        "logs": logs,
-        "total_logs": total_logs,
-        "taken_count": taken_count,
-        "missed_count": missed_count,
-        "skipped_count": skipped_count,
+        "logs": page,
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None,
+        "total_logs": counts["total"],
+        "taken_count": counts["taken"],
+        "missed_count": counts["missed"],
+        "skipped_count": counts["skipped"],
     })
 
 
+def parse_intake_cursor(value):
+    try:
+        day, pk = value.split("_")
+        return date.fromisoformat(day), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
 @role_required("patient")
 def intake_create(request):
     if request.method == "POST":
@@ -71,6 +130,117 @@ def intake_delete(request, pk):
     return render(request, "adherence/delete.html", {"obj": log})
 
 
+@role_required("patient")
+def intake_today(request):
+    """All of today's expected doses, logged together in one POST."""
+    today = timezone.localdate()
+    doses = get_today_doses([request.user.pk], today).get(request.user.pk, [])
+    schedule_ids = [dose.schedule_id for dose in doses]
+    valid_statuses = {value for value, _ in IntakeLog.STATUS_CHOICES}
+
+    if request.method == "POST":
+        statuses = {}
+        for schedule_id in schedule_ids:
+            status = request.POST.get(f"status_{schedule_id}")
+            if status in valid_statuses:
+                statuses[schedule_id] = status
+
+        if statuses:
+            result = log_doses(request.user, today, statuses)
+            messages.success(
+                request,
+                f"Saved {result['created'] + result['updated']} dose(s) for today."
+            )
+        return redirect("adherence:intake_today")
+
+    return render(request, "adherence/today.html", {
+        "rows": doses,
+        "today": today,
+        "status_choices": IntakeLog.STATUS_CHOICES,
+    })
+
+
+# ---------------------------
+# EXPORT (patient / doctor / family)
+# ---------------------------
+def can_view_intake(user, patient_user):
+    if user.role == "patient":
+        return user.pk == patient_user.pk
+
+    if user.role == "doctor":
+        return Appointment.objects.filter(doctor=user, patient=patient_user).exists()
+
+    if user.role == "family":
+        try:
+            profile = patient_user.patient_profile
+        except PatientProfile.DoesNotExist:
+            return False
+        return can_family_access_patient(user, profile)
+
+    return False
+
+
+@login_required
+def intake_export(request, patient_id):
+    """
+    Streams a patient's intake history as CSV (default) or NDJSON.
+    ?format=csv|ndjson&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    patient_user = get_object_or_404(User, pk=patient_id, role="patient")
+    if not can_view_intake(request.user, patient_user):
+        return HttpResponseForbidden()
+
+    try:
+        start_date = parse_export_date(request.GET.get("start"))
+        end_date = parse_export_date(request.GET.get("end"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid start or end date.")
+
+    rows = iter_intake_export_rows(patient_user, start_date=start_date, end_date=end_date)
+
+    if request.GET.get("format") == "ndjson":
+        response = StreamingHttpResponse(stream_ndjson(rows), content_type="application/x-ndjson")
+        extension = "ndjson"
+    else:
+        response = StreamingHttpResponse(stream_csv(rows), content_type="text/csv")
+        extension = "csv"
+
+    response["Content-Disposition"] = (
+        f'attachment; filename="intake-{patient_user.username}.{extension}"'
+    )
+    return response
+
+
+@login_required
+def adherence_heatmap(request, patient_id):
+    """
+    Year of per-day adherence codes for every schedule of a patient,
+    decoded from the monthly bitmaps. ?year=YYYY (defaults to this year)
+    """
+    patient_user = get_object_or_404(User, pk=patient_id, role="patient")
+    if not can_view_intake(request.user, patient_user):
+        return HttpResponseForbidden()
+
+    try:
+        year = int(request.GET.get("year", timezone.localdate().year))
+    except ValueError:
+        year = timezone.localdate().year
+
+    if not date.min.year <= year <= date.max.year:
+        return JsonResponse({"error": "Year out of range."}, status=400)
+
+    return JsonResponse({
+        "year": year,
+        "legend": {
+            AdherenceMonth.DAY_NONE: "none",
+            AdherenceMonth.DAY_TAKEN: "taken",
+            AdherenceMonth.DAY_MISSED: "missed",
+            AdherenceMonth.DAY_SKIPPED: "skipped",
+        },
+        "schedules": get_adherence_heatmap(patient_user, year),
+    })
+
+
 # ---------------------------
 # REMINDERS (patient)
 # ---------------------------
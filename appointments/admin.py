@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, AvailabilityException, WorkingHours
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -13,3 +13,17 @@ class AppointmentAdmin(admin.ModelAdmin):
     )
     list_filter = ("status", "appointment_date")
     search_fields = ("patient__username", "doctor__username")
+
+
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ("doctor", "weekday", "start_time", "end_time")
+    list_filter = ("weekday",)
+    search_fields = ("doctor__username",)
+
+
+@admin.register(AvailabilityException)
+class AvailabilityExceptionAdmin(admin.ModelAdmin):
+    list_display = ("doctor", "date", "start_time", "end_time", "is_available", "reason")
+    list_filter = ("is_available", "date")
+    search_fields = ("doctor__username", "reason")
@@ -0,0 +1,365 @@
+"""
+Doctor slot availability on a fixed 15-minute grid.
+
+Each day is a bitmap with one bit per slot from 7:00 to 20:00. Booked
+slots are stored per doctor/day in DoctorDaySlots. A doctor's working
+slots come from their WorkingHours / AvailabilityException rows,
+compiled into one mask per weekday plus per-date overrides and cached,
+for every doctor at once, in one entry of the shared cache; doctors
+without hours use WORKING_MASK (the clinic default, lunch 13:00-14:00
+masked out).
+"""
+from datetime import time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Appointment,
+    AvailabilityException,
+    BOOKED_STATUSES,
+    DoctorDaySlots,
+    WorkingHours,
+)
+
+SLOT_MINUTES = 15
+DAY_START = time(7, 0)
+DAY_END = time(20, 0)
+LUNCH_START = time(13, 0)
+LUNCH_END = time(14, 0)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+SLOT_TIMES = [
+    time(minute // 60, minute % 60)
+    for minute in range(_minutes(DAY_START), _minutes(DAY_END) + 1, SLOT_MINUTES)
+]
+
+WORKING_MASK = 0
+for _index, _slot in enumerate(SLOT_TIMES):
+    if not (LUNCH_START <= _slot < LUNCH_END):
+        WORKING_MASK |= 1 << _index
+
+
+def slot_index(value):
+    """Index of the grid slot containing `value`, or None outside working hours."""
+    if value < DAY_START or value > DAY_END:
+        return None
+    return (_minutes(value) - _minutes(DAY_START)) // SLOT_MINUTES
+
+
+def slot_index_after(value):
+    """Index of the first slot starting at or after `value`."""
+    if value <= DAY_START:
+        return 0
+    minutes = _minutes(value) - _minutes(DAY_START)
+    return min(-(-minutes // SLOT_MINUTES), len(SLOT_TIMES))
+
+
+def decode_slots(mask):
+    return [slot for index, slot in enumerate(SLOT_TIMES) if mask >> index & 1]
+
+
+def hours_mask(start, end):
+    """Bits of the grid slots starting in [start, end)."""
+    mask = 0
+    for index, slot in enumerate(SLOT_TIMES):
+        if start <= slot < end:
+            mask |= 1 << index
+    return mask
+
+
+# ---------------------------
+# COMPILED WORKING HOURS
+# ---------------------------
+# Invalidated whenever hours or exceptions change; the timeout only bounds
+# staleness from writes that bypass the signals
+AVAILABILITY_CACHE_TIMEOUT = 60 * 15
+
+AVAILABILITY_KEY = "doctor-availability"
+
+
+def _default_availability():
+    return {"weekly": [WORKING_MASK] * 7, "overrides": {}}
+
+
+def compile_availability(doctor_ids=None, today=None):
+    """
+    Compiles WorkingHours / AvailabilityException rows into
+    {doctor_id: {"weekly": [mask per weekday], "overrides": {date: mask}}}
+    with two queries. Covers `doctor_ids`, or every doctor with rows when
+    None. Past exceptions are dropped.
+    """
+    today = today or timezone.localdate()
+    hours = WorkingHours.objects.all()
+    exceptions = AvailabilityException.objects.filter(date__gte=today)
+    if doctor_ids is not None:
+        hours = hours.filter(doctor_id__in=doctor_ids)
+        exceptions = exceptions.filter(doctor_id__in=doctor_ids)
+
+    weekly = {}
+    for doctor_id, weekday, start, end in hours.values_list(
+        "doctor_id", "weekday", "start_time", "end_time"
+    ):
+        weekly.setdefault(doctor_id, [0] * 7)[weekday] |= hours_mask(start, end)
+
+    compiled = {
+        doctor_id: {"weekly": masks, "overrides": {}}
+        for doctor_id, masks in weekly.items()
+    }
+    for doctor_id in doctor_ids or ():
+        compiled.setdefault(doctor_id, _default_availability())
+
+    # Blocks are applied before extra hours on the same day
+    for doctor_id, day, start, end, is_available in exceptions.order_by("is_available").values_list(
+        "doctor_id", "date", "start_time", "end_time", "is_available"
+    ):
+        entry = compiled.setdefault(doctor_id, _default_availability())
+        mask = entry["overrides"].get(day, entry["weekly"][day.weekday()])
+        if is_available:
+            mask |= hours_mask(start, end)
+        elif start is None:
+            mask = 0
+        else:
+            mask &= ~hours_mask(start, end)
+        entry["overrides"][day] = mask
+
+    return compiled
+
+
+def get_availability(doctor_ids):
+    """
+    Compiled availability of many doctors. Every doctor's entry is kept
+    under one cache key, so a lookup is a single cache read and a miss
+    recompiles everything in two queries and one cache write.
+    """
+    compiled = cache.get(AVAILABILITY_KEY)
+    if compiled is None:
+        compiled = compile_availability()
+        cache.set(AVAILABILITY_KEY, compiled, AVAILABILITY_CACHE_TIMEOUT)
+
+    return {
+        doctor_id: compiled.get(doctor_id) or _default_availability()
+        for doctor_id in doctor_ids
+    }
+
+
+def invalidate_availability(doctor_id):
+    # After commit, so a lookup in between cannot cache the old hours again
+    transaction.on_commit(lambda: cache.delete(AVAILABILITY_KEY))
+
+
+def working_mask(availability, day):
+    """Working slots of one compiled doctor entry on `day`."""
+    return availability["overrides"].get(day, availability["weekly"][day.weekday()])
+
+
+def check_slot(doctor_id, day, at, availability=None):
+    """
+    The single booking rule for every path: returns an error message if
+    `doctor_id` does not work at `at` on `day`, else None. Callers checking
+    many slots of one doctor pass that doctor's compiled `availability`
+    so the cache is read once.
+    """
+    index = slot_index(at)
+    if index is None:
+        return "Appointments can only be booked between 7:00 AM and 8:00 PM."
+    if at.minute % SLOT_MINUTES or at.second:
+        return "Time must be in 15 minute intervals."
+
+    if availability is None:
+        availability = get_availability([doctor_id])[doctor_id]
+
+    mask = working_mask(availability, day)
+    if not mask:
+        return "The doctor is not available on this day."
+    if not mask >> index & 1:
+        return "The doctor is not available at this time."
+    return None
+
+
+def refresh_doctor_days(keys):
+    """
+    Rebuilds DoctorDaySlots rows for the given (doctor_id, date) keys.
+
+    The rows are inserted if missing and locked before the appointments
+    are read, so two bookings on the same doctor/day rebuild one after
+    the other and the second sees the first's appointment.
+    """
+    keys = {key for key in keys if key[0] is not None}
+    if not keys:
+        return
+
+    affected = Q()
+    for doctor_id, day in keys:
+        affected |= Q(doctor_id=doctor_id, date=day)
+
+    with transaction.atomic():
+        DoctorDaySlots.objects.bulk_create(
+            [DoctorDaySlots(doctor_id=doctor_id, date=day) for doctor_id, day in keys],
+            ignore_conflicts=True,
+        )
+        list(
+            DoctorDaySlots.objects.select_for_update()
+            .filter(affected)
+            .order_by("doctor_id", "date")
+            .values_list("pk", flat=True)
+        )
+
+        rows = Appointment.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in keys},
+            appointment_date__in={day for _, day in keys},
+            status__in=BOOKED_STATUSES,
+        ).values_list("doctor_id", "appointment_date", "appointment_time")
+
+        booked = {}
+        for doctor_id, day, appointment_time in rows:
+            index = slot_index(appointment_time)
+            if (doctor_id, day) in keys and index is not None:
+                booked[(doctor_id, day)] = booked.get((doctor_id, day), 0) | (1 << index)
+
+        if booked:
+            DoctorDaySlots.objects.bulk_create(
+                [
+                    DoctorDaySlots(doctor_id=doctor_id, date=day, booked=mask)
+                    for (doctor_id, day), mask in booked.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["doctor", "date"],
+                update_fields=["booked"],
+            )
+
+        empty = keys - set(booked)
+        if empty:
+            stale = Q()
+            for doctor_id, day in empty:
+                stale |= Q(doctor_id=doctor_id, date=day)
+            DoctorDaySlots.objects.filter(stale).delete()
+
+
+def get_free_slots(doctor, start_date, end_date, now=None):
+    """
+    Returns {date: [free slot times]} for one doctor from a single query
+    (plus the compiled hours on a cache miss). Slots already in the past
+    are left out.
+    """
+    booked = dict(
+        DoctorDaySlots.objects.filter(
+            doctor=doctor,
+            date__range=(start_date, end_date),
+        ).values_list("date", "booked")
+    )
+
+    availability = get_availability([doctor.pk])[doctor.pk]
+
+    now = timezone.localtime(now)
+    free = {}
+    day = start_date
+    while day <= end_date:
+        mask = working_mask(availability, day) & ~booked.get(day, 0)
+        if day == now.date():
+            mask &= ~((1 << slot_index_after(now.time())) - 1)
+        if day >= now.date() and mask:
+            free[day] = decode_slots(mask)
+        day += timedelta(days=1)
+
+    return free
+
+
+def slot_range_mask(time_from=None, time_to=None):
+    """Bits of the slots starting between `time_from` and `time_to` (inclusive)."""
+    mask = 0
+    for index, slot in enumerate(SLOT_TIMES):
+        if (time_from is None or slot >= time_from) and (time_to is None or slot <= time_to):
+            mask |= 1 << index
+    return mask
+
+
+def _bits(mask):
+    """Indexes of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def find_earliest_slots(start_date, end_date, time_from=None, time_to=None, limit=10, now=None):
+    """
+    Earliest free slots across all doctors in two queries (doctors, then
+    every booked-slot bitmap in the range) once working hours are cached.
+
+    Doctors are numbered 0..n-1. Doctors sharing a working mask are
+    grouped into one doctor bitmask, and each slot gets the bitmask of
+    doctors working in it and of doctors booked in it, so "who is free at
+    9:15" is one AND NOT over all doctors. Returns up to `limit`
+    (date, time, [doctor ids]) tuples, earliest first.
+    """
+    doctor_ids = list(
+        get_user_model().objects.filter(role="doctor", is_active=True)
+        .order_by("pk").values_list("pk", flat=True)
+    )
+    if not doctor_ids:
+        return []
+
+    position = {doctor_id: index for index, doctor_id in enumerate(doctor_ids)}
+    availability = get_availability(doctor_ids)
+
+    # {weekday: {working mask: doctor bitmask}} and the dated overrides
+    weekly_groups = [{} for _ in range(7)]
+    overrides = {}
+    for doctor_id, entry in availability.items():
+        bit = 1 << position[doctor_id]
+        for weekday, mask in enumerate(entry["weekly"]):
+            weekly_groups[weekday][mask] = weekly_groups[weekday].get(mask, 0) | bit
+        for day, mask in entry["overrides"].items():
+            overrides.setdefault(day, []).append((bit, entry["weekly"][day.weekday()], mask))
+
+    booked_by_day = {}
+    for doctor_id, day, mask in DoctorDaySlots.objects.filter(
+        date__range=(start_date, end_date),
+        doctor_id__in=doctor_ids,
+    ).values_list("doctor_id", "date", "booked"):
+        booked_by_day.setdefault(day, []).append((position[doctor_id], mask))
+
+    now = timezone.localtime(now)
+    wanted = slot_range_mask(time_from, time_to)
+
+    results = []
+    day = max(start_date, now.date())
+    while day <= end_date and len(results) < limit:
+        day_mask = wanted
+        if day == now.date():
+            day_mask &= ~((1 << slot_index_after(now.time())) - 1)
+
+        groups = dict(weekly_groups[day.weekday()])
+        for bit, usual, mask in overrides.get(day, ()):
+            groups[usual] &= ~bit
+            groups[mask] = groups.get(mask, 0) | bit
+
+        # Per-slot bitmasks of working doctors and of booked doctors
+        working = {}
+        for mask, doctors in groups.items():
+            for index in _bits(mask & day_mask):
+                working[index] = working.get(index, 0) | doctors
+
+        busy = {}
+        for doctor_bit, mask in booked_by_day.get(day, ()):
+            for index in _bits(mask & day_mask):
+                busy[index] = busy.get(index, 0) | (1 << doctor_bit)
+
+        for index in sorted(working):
+            free = working[index] & ~busy.get(index, 0)
+            if free:
+                results.append((day, SLOT_TIMES[index], [doctor_ids[bit] for bit in _bits(free)]))
+                if len(results) == limit:
+                    break
+
+        day += timedelta(days=1)
+
+    return results
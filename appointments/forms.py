@@ -1,5 +1,6 @@
 from django import forms
 from django.utils import timezone
+from .availability import check_slot
 from .models import Appointment
 
 
@@ -35,7 +36,7 @@ class AppointmentRequestForm(forms.ModelForm):
             'reason': 'Reason for Appointment',
         }
         help_texts = {
-            'appointment_time': 'Office hours: 7:00 AM - 8:00 PM (Lunch break: 1:00 PM - 2:00 PM)',
+            'appointment_time': 'Working hours vary by doctor; pick one of the available slots.',
         }
 
     def __init__(self, *args, **kwargs):
@@ -69,6 +70,13 @@ class AppointmentRequestForm(forms.ModelForm):
                 "You cannot create an appointment for a past date or time."
             )
 
+        # Doctor's working hours, lunch break and holidays
+        doctor = cleaned_data.get("doctor")
+        if doctor:
+            error = check_slot(doctor.pk, appointment_date, appointment_time)
+            if error:
+                raise forms.ValidationError(error)
+
         return cleaned_data
 
 
@@ -100,4 +108,18 @@ class AppointmentDoctorUpdateForm(forms.ModelForm):
             'appointment_date': 'Date',
             'appointment_time': 'Time',
             'reason': 'Reason',
-        }
\ No newline at end of file
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        appointment_date = cleaned_data.get("appointment_date")
+        appointment_time = cleaned_data.get("appointment_time")
+
+        moved = {"appointment_date", "appointment_time"} & set(self.changed_data)
+        if moved and appointment_date and appointment_time and self.instance.doctor_id:
+            error = check_slot(self.instance.doctor_id, appointment_date, appointment_time)
+            if error:
+                raise forms.ValidationError(error)
+
+        return cleaned_data
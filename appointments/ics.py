@@ -0,0 +1,128 @@
+"""
+iCalendar (RFC 5545) rendering of appointments for the calendar feeds.
+
+Events are yielded line by line from a server-side cursor, so a feed is
+streamed without building the whole calendar in memory.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .availability import SLOT_MINUTES
+from .models import Appointment
+
+# Past appointments older than this are left out of the feed
+FEED_HISTORY_DAYS = 90
+
+EVENT_STATUS = {
+    "requested": "TENTATIVE",
+    "approved": "CONFIRMED",
+    "completed": "CONFIRMED",
+}
+
+
+def feed_appointments(user, today=None):
+    """The appointments shown in `user`'s feed (as doctor or as patient)."""
+    since = (today or timezone.localdate()) - timedelta(days=FEED_HISTORY_DAYS)
+    if user.role == "doctor":
+        return Appointment.objects.filter(doctor=user, appointment_date__gte=since)
+    return Appointment.objects.filter(patient=user, appointment_date__gte=since)
+
+
+def feed_version(queryset):
+    """
+    (latest updated_at, row count) of the feed in one aggregate query.
+    The count makes deleted rows and rows ageing out change the version.
+    """
+    summary = queryset.aggregate(latest=Max("updated_at"), count=Count("id"))
+    return summary["latest"], summary["count"]
+
+
+def _escape(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    """Folds content lines longer than 75 octets (RFC 5545 3.1)."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _name(user):
+    return " ".join(part for part in (user["first_name"], user["last_name"]) if part) or user["username"]
+
+
+def iter_ics(user, queryset, host, chunk_size=500):
+    """Yields the VCALENDAR for `queryset`, one event per chunk."""
+    yield "".join(_fold(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//MediTracker//Appointments//EN",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:MediTracker appointments",
+    ))
+
+    other = "patient" if user.role == "doctor" else "doctor"
+    rows = queryset.order_by("appointment_date", "appointment_time").values(
+        "id",
+        "appointment_date",
+        "appointment_time",
+        "reason",
+        "status",
+        "updated_at",
+        f"{other}__username",
+        f"{other}__first_name",
+        f"{other}__last_name",
+    )
+
+    for row in rows.iterator(chunk_size=chunk_size):
+        start = timezone.make_aware(datetime.combine(row["appointment_date"], row["appointment_time"]))
+        person = {
+            key: row[f"{other}__{key}"] or ""
+            for key in ("username", "first_name", "last_name")
+        }
+        if other == "doctor":
+            title = f"Appointment with Dr. {_name(person)}" if person["username"] else "Appointment"
+        else:
+            title = f"Appointment with {_name(person)}"
+
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:appointment-{row['id']}@{host}",
+            f"DTSTAMP:{_utc(row['updated_at'])}",
+            f"DTSTART:{_utc(start)}",
+            f"DTEND:{_utc(start + timedelta(minutes=SLOT_MINUTES))}",
+            f"SUMMARY:{_escape(title)}",
+        ]
+        if row["reason"]:
+            lines.append(f"DESCRIPTION:{_escape(row['reason'])}")
+        lines += [
+            f"STATUS:{EVENT_STATUS.get(row['status'], 'CANCELLED')}",
+            "END:VEVENT",
+        ]
+        yield "".join(_fold(line) for line in lines)
+
+    yield _fold("END:VCALENDAR")
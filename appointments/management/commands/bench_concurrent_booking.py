@@ -0,0 +1,77 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count
+
+from appointments.availability import SLOT_TIMES
+from appointments.models import Appointment, BOOKED_STATUSES
+from appointments.services import save_booking
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel booking requests at a few slots of a throwaway doctor "
+        "and check that no slot ends up double-booked. Use a server database "
+        "(PostgreSQL); SQLite serialises writers and reports lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--slots", type=int, default=4)
+        parser.add_argument("--workers", type=int, default=16)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        doctor = User.objects.create_user(username=f"bench-doc-{tag}", role="doctor")
+        patients = [
+            User.objects.create_user(username=f"bench-pat-{tag}-{n}", role="patient")
+            for n in range(options["workers"])
+        ]
+        day = date.today() + timedelta(days=30)
+        slots = SLOT_TIMES[:options["slots"]]
+
+        def book(n):
+            try:
+                return save_booking(Appointment(
+                    patient=patients[n % len(patients)],
+                    doctor=doctor,
+                    appointment_date=day,
+                    appointment_time=slots[n % len(slots)],
+                    status="requested",
+                ))
+            except OperationalError:
+                return None
+            finally:
+                connection.close()
+
+        try:
+            began = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                results = list(pool.map(book, range(options["requests"])))
+            elapsed = time.perf_counter() - began
+
+            doubled = Appointment.objects.filter(
+                doctor=doctor, status__in=BOOKED_STATUSES
+            ).values("appointment_date", "appointment_time").annotate(
+                bookings=Count("id")
+            ).filter(bookings__gt=1).count()
+
+            self.stdout.write(
+                f"{len(results)} requests in {elapsed:.2f} s "
+                f"({len(results) / elapsed:.0f} req/s): "
+                f"{results.count(True)} booked, {results.count(False)} rejected, "
+                f"{results.count(None)} lock errors"
+            )
+            if doubled:
+                raise CommandError(f"{doubled} slots double-booked")
+            self.stdout.write(self.style.SUCCESS("No double bookings."))
+        finally:
+            Appointment.objects.filter(doctor=doctor).delete()
+            User.objects.filter(pk__in=[doctor.pk] + [p.pk for p in patients]).delete()
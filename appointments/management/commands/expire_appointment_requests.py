@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from appointments.services import expire_stale_requests
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointment requests whose date has passed to the stored "
+        "\"missed\" status. Run shortly after midnight; safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Appointments updated per statement.",
+        )
+
+    def handle(self, *args, **options):
+        count = expire_stale_requests(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Marked {count} appointment requests as missed."))
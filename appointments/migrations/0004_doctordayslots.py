@@ -0,0 +1,69 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:50
+
+from datetime import time
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The 15-minute grid as it stood when this migration was written, copied
+# here so later changes to appointments.availability leave it untouched
+SLOT_MINUTES = 15
+DAY_START = time(7, 0)
+DAY_END = time(20, 0)
+
+
+def slot_index(value):
+    if value < DAY_START or value > DAY_END:
+        return None
+    minutes = value.hour * 60 + value.minute - (DAY_START.hour * 60 + DAY_START.minute)
+    return minutes // SLOT_MINUTES
+
+
+def build_day_slots(apps, schema_editor):
+    """Builds the booked-slot bitmaps for appointments that already exist."""
+    Appointment = apps.get_model("appointments", "Appointment")
+    DoctorDaySlots = apps.get_model("appointments", "DoctorDaySlots")
+
+    booked = {}
+    rows = Appointment.objects.filter(
+        doctor__isnull=False,
+        status__in=["requested", "approved", "completed"],
+    ).values_list("doctor_id", "appointment_date", "appointment_time")
+
+    for doctor_id, day, appointment_time in rows.iterator():
+        index = slot_index(appointment_time)
+        if index is not None:
+            booked[(doctor_id, day)] = booked.get((doctor_id, day), 0) | (1 << index)
+
+    DoctorDaySlots.objects.bulk_create(
+        [
+            DoctorDaySlots(doctor_id=doctor_id, date=day, booked=mask)
+            for (doctor_id, day), mask in booked.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_created_by_family'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDaySlots',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked', models.BigIntegerField(default=0)),
+                ('doctor', models.ForeignKey(limit_choices_to={'role': 'doctor'}, on_delete=django.db.models.deletion.CASCADE, related_name='day_slots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('doctor', 'date')},
+            },
+        ),
+        migrations.RunPython(build_day_slots, migrations.RunPython.noop),
+    ]
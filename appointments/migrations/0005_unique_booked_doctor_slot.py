@@ -0,0 +1,47 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+BOOKED_STATUSES = ("requested", "approved", "completed")
+
+
+def cancel_double_bookings(apps, schema_editor):
+    """
+    Existing double bookings would block the constraint: keep the oldest
+    booking of each doctor/date/time and cancel the later ones.
+    """
+    Appointment = apps.get_model("appointments", "Appointment")
+
+    clashes = Appointment.objects.filter(
+        doctor__isnull=False,
+        status__in=BOOKED_STATUSES,
+    ).values("doctor_id", "appointment_date", "appointment_time").annotate(
+        keep=Min("id"),
+        bookings=Count("id"),
+    ).filter(bookings__gt=1).order_by()
+
+    for clash in clashes:
+        Appointment.objects.filter(
+            doctor_id=clash["doctor_id"],
+            appointment_date=clash["appointment_date"],
+            appointment_time=clash["appointment_time"],
+            status__in=BOOKED_STATUSES,
+        ).exclude(pk=clash["keep"]).update(status="cancelled")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_doctordayslots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('requested', 'approved', 'completed'))), fields=('doctor', 'appointment_date', 'appointment_time'), name='unique_booked_doctor_slot'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:20
+
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def expire_stale_requests(apps, schema_editor):
+    Appointment = apps.get_model("appointments", "Appointment")
+    Appointment.objects.filter(
+        status="requested",
+        appointment_date__lt=date.today(),
+    ).update(status="missed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_doctor_requested_idx',
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('requested', 'Requested'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('missed', 'Missed')], default='requested', max_length=20),
+        ),
+        migrations.RunPython(expire_stale_requests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['requested', 'missed'])), fields=['doctor', 'status', 'appointment_date'], name='appt_doctor_open_idx'),
+        ),
+    ]
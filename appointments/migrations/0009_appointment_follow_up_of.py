@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_follow_ups(apps, schema_editor):
+    """
+    Links every appointment to the visit that set a follow-up for its date,
+    preferring the latest such visit (as the old date lookup did).
+    """
+    Appointment = apps.get_model("appointments", "Appointment")
+
+    sources = {}
+    for pk, patient_id, follow_up_date in Appointment.objects.filter(
+        follow_up_date__isnull=False,
+    ).order_by("appointment_date", "pk").values_list("pk", "patient_id", "follow_up_date").iterator():
+        sources[(patient_id, follow_up_date)] = pk
+
+    linked = []
+    for appt in Appointment.objects.filter(
+        patient_id__in={patient_id for patient_id, _ in sources},
+    ).only("pk", "patient_id", "appointment_date").iterator():
+        source = sources.get((appt.patient_id, appt.appointment_date))
+        if source and source != appt.pk:
+            appt.follow_up_of_id = source
+            linked.append(appt)
+
+    Appointment.objects.bulk_update(linked, ["follow_up_of"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_calendarfeed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='follow_up_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='follow_ups', to='appointments.appointment'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('follow_up_date__isnull', False)), fields=['patient', 'follow_up_date'], name='appt_patient_follow_up_idx'),
+        ),
+        migrations.RunPython(link_follow_ups, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,12 @@
+import secrets
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
+from django.urls import reverse
+
+# Statuses that occupy a doctor's slot
+BOOKED_STATUSES = ("requested", "approved", "completed")
 
 
 class Appointment(models.Model):
@@ -9,6 +16,7 @@ class Appointment(models.Model):
         ("rejected", "Rejected"),
         ("completed", "Completed"),
         ("cancelled", "Cancelled"),
+        ("missed", "Missed"),
     )
 
     patient = models.ForeignKey(
@@ -37,6 +45,14 @@ class Appointment(models.Model):
     # (Optional but Professional)
     follow_up_date = models.DateField(blank=True, null=True)
 
+    # The visit whose follow_up_date this appointment fulfils
+    follow_up_of = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name="follow_ups",
+    )
+
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -54,5 +70,175 @@ class Appointment(models.Model):
     related_name="appointments_created_for_family",
     limit_choices_to={"role": "family"},
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "appointment_date", "appointment_time"],
+                condition=models.Q(status__in=BOOKED_STATUSES),
+                name="unique_booked_doctor_slot",
+            ),
+        ]
+        indexes = [
+            # Doctor list / dashboard "today" / slot bitmaps
+            models.Index(
+                fields=["doctor", "appointment_date", "appointment_time"],
+                name="appt_doctor_date_time_idx",
+            ),
+            # Pending and missed counters only look at open / expired requests
+            models.Index(
+                fields=["doctor", "status", "appointment_date"],
+                condition=models.Q(status__in=["requested", "missed"]),
+                name="appt_doctor_open_idx",
+            ),
+            # Review history, family appointment lists, follow-up lookup
+            models.Index(
+                fields=["patient", "appointment_date", "appointment_time"],
+                name="appt_patient_date_time_idx",
+            ),
+            # Linking a new booking to the visit that asked for it
+            models.Index(
+                fields=["patient", "follow_up_date"],
+                condition=models.Q(follow_up_date__isnull=False),
+                name="appt_patient_follow_up_idx",
+            ),
+            # Patient's own list (newest request first)
+            models.Index(
+                fields=["patient", "-created_at"],
+                name="appt_patient_created_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # auto_now only writes fields being saved; the calendar feeds are
+        # versioned on updated_at, so every partial save must bump it
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "updated_at" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "updated_at"]
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.patient} → {self.doctor} ({self.status})"
+
+
+class DoctorDaySlots(models.Model):
+    """
+    Bitmap of a doctor's booked 15-minute slots for one day
+    (bit i = appointments.availability.SLOT_TIMES[i]).
+    Rebuilt from Appointment rows by appointments.signals.
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="day_slots",
+        limit_choices_to={"role": "doctor"},
+    )
+
+    date = models.DateField()
+    booked = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("doctor", "date")
+
+    def __str__(self):
+        return f"{self.doctor} - {self.date}"
+
+
+
+class WorkingHours(models.Model):
+    """
+    One weekly working period of a doctor (end exclusive); a day may have
+    several, e.g. 9:00-13:00 and 14:00-18:00. Doctors without any rows
+    keep the clinic default (7:00-20:00, lunch 13:00-14:00, every day).
+    Compiled into slot masks by appointments.availability.
+    """
+    WEEKDAYS = (
+        (0, "Monday"),
+        (1, "Tuesday"),
+        (2, "Wednesday"),
+        (3, "Thursday"),
+        (4, "Friday"),
+        (5, "Saturday"),
+        (6, "Sunday"),
+    )
+
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="working_hours",
+        limit_choices_to={"role": "doctor"},
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ["doctor", "weekday", "start_time"]
+        indexes = [
+            models.Index(fields=["doctor", "weekday"], name="hours_doctor_weekday_idx"),
+        ]
+
+    def clean(self):
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time.")
+
+    def __str__(self):
+        return f"{self.doctor} {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+
+class AvailabilityException(models.Model):
+    """
+    A dated change to a doctor's weekly hours: a holiday (no times), a
+    blocked period, or extra hours (is_available=True).
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="availability_exceptions",
+        limit_choices_to={"role": "doctor"},
+    )
+    date = models.DateField()
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True)
+    is_available = models.BooleanField(default=False)
+    reason = models.CharField(max_length=150, blank=True)
+
+    class Meta:
+        ordering = ["doctor", "date", "start_time"]
+        indexes = [
+            models.Index(fields=["doctor", "date"], name="exception_doctor_date_idx"),
+        ]
+
+    def clean(self):
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError("Give both a start and an end time, or neither for the whole day.")
+        if self.start_time and self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time.")
+        if self.is_available and self.start_time is None:
+            raise ValidationError("Extra working hours need a start and end time.")
+
+    def __str__(self):
+        kind = "extra hours" if self.is_available else "unavailable"
+        return f"{self.doctor} {self.date} {kind}"
+
+class CalendarFeed(models.Model):
+    """
+    Secret-token iCalendar feed of a doctor's or patient's appointments.
+    The token is the only credential, so calendar apps can poll it.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="calendar_feed",
+    )
+    token = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def rotate(self):
+        self.token = secrets.token_urlsafe(32)
+
+    def get_absolute_url(self):
+        return reverse("appointments:calendar_feed", args=[self.token])
+
     def __str__(self):
-        return f"{self.patient} → {self.doctor} ({self.status})"
\ No newline at end of file
+        return f"Calendar feed of {self.user}"
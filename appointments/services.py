@@ -0,0 +1,320 @@
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .availability import check_slot, get_availability, refresh_doctor_days
+from .models import Appointment, BOOKED_STATUSES
+
+# Invalidated on every appointment change; the timeout only bounds
+# staleness from writes that bypass the signals
+DASHBOARD_CACHE_TIMEOUT = 60 * 15
+
+
+def save_booking(appointment, update_fields=None):
+    """
+    Saves an appointment, relying on the unique_booked_doctor_slot
+    constraint instead of a check-then-insert. Returns False when the
+    doctor's slot is already taken (including by a concurrent request).
+    """
+    try:
+        with transaction.atomic():
+            appointment.save(update_fields=update_fields)
+    except IntegrityError:
+        return False
+    return True
+
+
+# ---------------------------
+# FOLLOW-UP LINKS
+# ---------------------------
+def link_follow_up(appointment):
+    """
+    Points a new booking at the patient's visit that set a follow-up for
+    its date (if any). Called before the booking is saved.
+    """
+    appointment.follow_up_of = Appointment.objects.filter(
+        patient_id=appointment.patient_id,
+        follow_up_date=appointment.appointment_date,
+    ).exclude(
+        pk=appointment.pk
+    ).order_by("-appointment_date").first()
+
+
+def set_follow_up(appointment, follow_up_date):
+    """
+    Records `appointment`'s follow-up date and links the patient's
+    appointment on that date to it. Returns the linked appointment.
+    """
+    appointment.follow_up_date = follow_up_date
+    appointment.follow_ups.exclude(appointment_date=follow_up_date).update(follow_up_of=None)
+
+    if follow_up_date is None:
+        return None
+
+    next_appt = Appointment.objects.filter(
+        patient_id=appointment.patient_id,
+        appointment_date=follow_up_date,
+    ).exclude(
+        pk=appointment.pk
+    ).order_by("appointment_time").first()
+
+    if next_appt and next_appt.follow_up_of_id != appointment.pk:
+        next_appt.follow_up_of = appointment
+        next_appt.save(update_fields=["follow_up_of"])
+    return next_appt
+
+
+# ---------------------------
+# DOCTOR DASHBOARD COUNTERS
+# ---------------------------
+def _counters_key(doctor_id, day):
+    # The date is part of the key: "today" and "missed" roll over at midnight
+    return f"doctor-dashboard:{doctor_id}:{day.isoformat()}"
+
+
+def get_doctor_counters(doctor):
+    """
+    Pending / today / missed / approved counts for the doctor dashboard,
+    computed in one query and cached until an appointment of the doctor
+    changes.
+    """
+    today = timezone.localdate()
+    key = _counters_key(doctor.pk, today)
+
+    counters = cache.get(key)
+    if counters is None:
+        counters = Appointment.objects.filter(doctor=doctor).aggregate(
+            pending=Count("id", filter=Q(status="requested")),
+            today=Count("id", filter=Q(appointment_date=today) & ~Q(status="cancelled")),
+            missed=Count("id", filter=Q(status="missed")),
+            approved=Count("id", filter=Q(status="approved")),
+        )
+        cache.set(key, counters, DASHBOARD_CACHE_TIMEOUT)
+    return counters
+
+
+def invalidate_doctor_counters(doctor_ids):
+    """
+    Drops the cached counters once the current transaction commits, so a
+    dashboard load in between cannot cache the old counts again.
+    """
+    today = timezone.localdate()
+    keys = [
+        _counters_key(doctor_id, today)
+        for doctor_id in set(doctor_ids) if doctor_id
+    ]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# ---------------------------
+# BULK DOCTOR ACTIONS
+# ---------------------------
+BULK_ACTIONS = ("approve", "reject", "complete", "reschedule")
+
+
+def _check_action(appt, action, today):
+    """Per-row rules of review_appointment / reschedule_appointment."""
+    if action == "approve":
+        if appt.status != "requested" or appt.appointment_date < today:
+            return "Only upcoming requests can be approved."
+    elif action == "reject":
+        if appt.status != "requested":
+            return "Only requests can be rejected."
+    elif action == "complete":
+        if appt.status != "approved" or appt.appointment_date != today:
+            return "Only today's approved appointments can be completed."
+    elif appt.appointment_date < today and appt.status not in ("requested", "missed"):
+        return "Past appointments cannot be rescheduled."
+    return None
+
+
+SLOT_TAKEN = "This slot is already booked by another patient."
+
+# Attempts at writing a reschedule batch that loses a target slot to a
+# concurrent booking between the clash check and the write
+BULK_WRITE_ATTEMPTS = 3
+
+# Transient status (outside BOOKED_STATUSES) that takes moving rows out of
+# unique_booked_doctor_slot while the batch is written
+MOVING_STATUS = "cancelled"
+
+BULK_FIELDS = ["status", "appointment_date", "appointment_time", "updated_at"]
+
+
+def _booked_slots(doctor, days):
+    """{(date, time): appointment id} of the doctor's bookings on `days`."""
+    return {
+        (day, at): pk
+        for pk, day, at in Appointment.objects.filter(
+            doctor=doctor,
+            status__in=BOOKED_STATUSES,
+            appointment_date__in=days,
+        ).values_list("pk", "appointment_date", "appointment_time")
+    }
+
+
+def _slot_clashes(doctor, ids, targets):
+    """
+    Rows of `targets` ({pk: (date, time)}) whose target slot stays taken.
+    A slot held by a row that moves away is free, so chain shifts pass;
+    a row that cannot move keeps its slot, which may block others, so
+    this repeats until no new clash is found. Among rows aiming at the
+    same slot, the first in `ids` wins.
+    """
+    taken = _booked_slots(doctor, {day for day, _ in targets.values()})
+    moving = [pk for pk in ids if pk in targets]
+    clashes = set()
+
+    while True:
+        still_moving = set(moving)
+        claimed = {}
+        failed = []
+        for pk in moving:
+            slot = targets[pk]
+            holder = taken.get(slot, pk)
+            if (holder != pk and holder not in still_moving) or claimed.setdefault(slot, pk) != pk:
+                failed.append(pk)
+
+        if not failed:
+            return clashes
+        clashes.update(failed)
+        moving = [pk for pk in moving if pk not in clashes]
+
+
+def apply_bulk_action(doctor, ids, action, days=0, minutes=0):
+    """
+    Applies one action to many of the doctor's appointments in a single
+    transaction. Rows failing a rule are left untouched; the valid ones
+    are written with one bulk_update. Returns [{"id", "ok", "error"}] in
+    the order of `ids`.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+
+    today = timezone.localdate()
+    shift = timedelta(days=days, minutes=minutes)
+    errors = {}
+
+    with transaction.atomic():
+        rows = {
+            appt.pk: appt
+            for appt in Appointment.objects.select_for_update().filter(doctor=doctor, pk__in=ids)
+        }
+
+        availability = get_availability([doctor.pk])[doctor.pk] if action == "reschedule" else None
+        targets = {}
+        for pk in ids:
+            appt = rows.get(pk)
+            if appt is None:
+                errors[pk] = "Appointment not found."
+                continue
+
+            error = _check_action(appt, action, today)
+            if error is None and action == "reschedule":
+                moved = datetime.combine(appt.appointment_date, appt.appointment_time) + shift
+                if moved.date() < today:
+                    error = "You cannot select a past date."
+                else:
+                    error = check_slot(doctor.pk, moved.date(), moved.time(), availability)
+                if error is None:
+                    targets[pk] = (moved.date(), moved.time())
+
+            if error:
+                errors[pk] = error
+
+        original = {
+            pk: (appt.status, appt.appointment_date, appt.appointment_time, appt.updated_at)
+            for pk, appt in rows.items()
+        }
+
+        for attempt in range(BULK_WRITE_ATTEMPTS):
+            clashes = _slot_clashes(doctor, ids, targets) if targets else set()
+
+            now = timezone.now()
+            slot_keys = set()
+            changed = []
+            for pk in ids:
+                appt = rows.get(pk)
+                if appt is None or pk in errors or pk in clashes:
+                    continue
+
+                slot_keys.add((appt.doctor_id, appt.appointment_date))
+                if action == "approve":
+                    appt.status = "approved"
+                elif action == "reject":
+                    appt.status = "rejected"
+                elif action == "complete":
+                    appt.status = "completed"
+                else:
+                    appt.appointment_date, appt.appointment_time = targets[pk]
+                    appt.status = "approved"
+                    slot_keys.add((appt.doctor_id, appt.appointment_date))
+
+                # bulk_update skips auto_now
+                appt.updated_at = now
+                changed.append(appt)
+
+            try:
+                with transaction.atomic():
+                    if action == "reschedule":
+                        # The slot index is checked row by row, so a chain shift
+                        # written in one UPDATE could collide with itself
+                        Appointment.objects.filter(
+                            pk__in=[appt.pk for appt in changed]
+                        ).update(status=MOVING_STATUS)
+                    Appointment.objects.bulk_update(changed, BULK_FIELDS)
+                break
+            except IntegrityError:
+                # A concurrent booking took a target slot after the clash
+                # check; recheck against the committed bookings
+                for pk, appt in rows.items():
+                    appt.status, appt.appointment_date, appt.appointment_time, appt.updated_at = original[pk]
+        else:
+            clashes |= {appt.pk for appt in changed}
+            slot_keys = set()
+
+        for pk in clashes:
+            errors[pk] = SLOT_TAKEN
+
+        # bulk_update bypasses the model signals
+        refresh_doctor_days(slot_keys)
+        invalidate_doctor_counters([doctor.pk])
+
+    return [
+        {"id": pk, "ok": pk not in errors, "error": errors.get(pk)}
+        for pk in ids
+    ]
+
+
+# ---------------------------
+# STALE REQUEST EXPIRY
+# ---------------------------
+def expire_stale_requests(today=None, chunk_size=1000):
+    """
+    Moves requests whose date has passed to the stored "missed" status,
+    one UPDATE per chunk. Safe to rerun: expired rows no longer match.
+    Returns the number of appointments expired.
+    """
+    today = today or timezone.localdate()
+    stale = Appointment.objects.filter(status="requested", appointment_date__lt=today)
+
+    expired = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(stale.order_by("pk").values_list("pk", "doctor_id", "appointment_date")[:chunk_size])
+            if not chunk:
+                break
+
+            expired += Appointment.objects.filter(
+                pk__in=[pk for pk, _, _ in chunk],
+                status="requested",
+            ).update(status="missed", updated_at=timezone.now())
+
+            # .update() bypasses the model signals
+            refresh_doctor_days({(doctor_id, day) for _, doctor_id, day in chunk})
+            invalidate_doctor_counters(doctor_id for _, doctor_id, _ in chunk)
+
+    return expired
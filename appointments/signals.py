@@ -0,0 +1,47 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .availability import invalidate_availability, refresh_doctor_days
+from .models import Appointment, AvailabilityException, WorkingHours
+from .services import invalidate_doctor_counters
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_slot(sender, instance, raw=False, **kwargs):
+    """Remember the doctor/day an edited appointment used to occupy."""
+    instance._previous_slot_key = None
+
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_slot_key = Appointment.objects.filter(pk=instance.pk).values_list(
+        "doctor_id", "appointment_date"
+    ).first()
+
+
+@receiver(post_save, sender=Appointment)
+def update_slots_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    keys = {(instance.doctor_id, instance.appointment_date)}
+    previous = getattr(instance, "_previous_slot_key", None)
+    if previous:
+        keys.add(previous)
+
+    refresh_doctor_days(keys)
+    invalidate_doctor_counters(doctor_id for doctor_id, _ in keys)
+
+
+@receiver(post_delete, sender=Appointment)
+def update_slots_on_delete(sender, instance, **kwargs):
+    refresh_doctor_days([(instance.doctor_id, instance.appointment_date)])
+    invalidate_doctor_counters([instance.doctor_id])
+
+
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+@receiver(post_save, sender=AvailabilityException)
+@receiver(post_delete, sender=AvailabilityException)
+def recompile_availability(sender, instance, **kwargs):
+    invalidate_availability(instance.doctor_id)
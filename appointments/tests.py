@@ -1,3 +1,637 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .availability import SLOT_TIMES, WORKING_MASK, find_earliest_slots, get_availability, get_free_slots
+from . import views
+from .models import Appointment, AvailabilityException, CalendarFeed, DoctorDaySlots, WorkingHours
+from . import services
+from .services import expire_stale_requests, save_booking
+
+User = get_user_model()
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+DATABASE_CACHE = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "meditracker_cache"}}
+
+
+class DoctorPatientMixin:
+    """The doctor / patient pair most classes below book appointments between."""
+
+    doctor_first_name = ""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            username="doc", password="x", role="doctor", first_name=cls.doctor_first_name
+        )
+        cls.patient = User.objects.create_user(username="pat", password="x", role="patient")
+
+    @classmethod
+    def create_appointment(cls, day, at=time(9, 0), status="requested", **kwargs):
+        return Appointment.objects.create(
+            patient=cls.patient,
+            doctor=cls.doctor,
+            appointment_date=day,
+            appointment_time=at,
+            status=status,
+            **kwargs
+        )
+
+
+class SlotAvailabilityTests(DoctorPatientMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.day = date(2030, 5, 6)
+
+    def book(self, at, **kwargs):
+        return self.create_appointment(self.day, at, **kwargs)
+
+    def test_grid_masks_lunch(self):
+        self.assertEqual(len(SLOT_TIMES), 53)
+        free = get_free_slots(self.doctor, self.day, self.day, now=timezone.make_aware(datetime(2030, 1, 1)))
+        self.assertNotIn(time(13, 0), free[self.day])
+        self.assertIn(time(14, 0), free[self.day])
+        self.assertEqual(len(free[self.day]), bin(WORKING_MASK).count("1"))
+
+    def test_grid_follows_book_cancel_and_reschedule(self):
+        now = timezone.make_aware(datetime(2030, 1, 1))
+        appt = self.book(time(9, 0))
+        self.assertNotIn(time(9, 0), get_free_slots(self.doctor, self.day, self.day, now)[self.day])
+
+        appt.appointment_time = time(10, 30)
+        appt.save()
+        free = get_free_slots(self.doctor, self.day, self.day, now)[self.day]
+        self.assertIn(time(9, 0), free)
+        self.assertNotIn(time(10, 30), free)
+
+        appt.status = "cancelled"
+        appt.save(update_fields=["status"])
+        self.assertFalse(DoctorDaySlots.objects.exists())
+
+    def test_grid_rebuild_locks_the_day_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.book(time(9, 0))
+
+        if connection.features.has_select_for_update:
+            self.assertTrue(any("FOR UPDATE" in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(DoctorDaySlots.objects.get().booked, 1 << SLOT_TIMES.index(time(9, 0)))
+
+    def test_free_slots_api(self):
+        self.book(time(7, 0))
+        self.client.force_login(self.patient)
+
+        response = self.client.get(
+            reverse("appointments:free_slots", args=[self.doctor.pk]),
+            {"start": self.day.isoformat(), "end": self.day.isoformat()},
+        )
+
+        slots = response.json()["slots"][self.day.isoformat()]
+        self.assertEqual(slots[0], "07:15")
+        self.assertNotIn("13:30", slots)
+
+    def test_free_slots_api_rejects_impossible_date(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(
+            reverse("appointments:free_slots", args=[self.doctor.pk]), {"start": "2030-02-30"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingConstraintTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username="doc", password="x", role="doctor")
+        cls.first = User.objects.create_user(username="pat1", password="x", role="patient")
+        cls.second = User.objects.create_user(username="pat2", password="x", role="patient")
+        cls.day = date(2030, 5, 6)
+
+    def appointment(self, patient, status="requested"):
+        return Appointment(
+            patient=patient,
+            doctor=self.doctor,
+            appointment_date=self.day,
+            appointment_time=time(9, 0),
+            status=status,
+        )
+
+    def test_second_active_booking_is_rejected(self):
+        self.assertTrue(save_booking(self.appointment(self.first)))
+        self.assertFalse(save_booking(self.appointment(self.second)))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_cancelled_booking_frees_the_slot(self):
+        save_booking(self.appointment(self.first, status="cancelled"))
+        self.assertTrue(save_booking(self.appointment(self.second)))
+
+    def test_request_view_reports_taken_slot(self):
+        save_booking(self.appointment(self.first))
+        self.client.force_login(self.second)
+
+        response = self.client.post(reverse("appointments:request"), {
+            "doctor": self.doctor.pk,
+            "appointment_date": self.day.isoformat(),
+            "appointment_time": "09:00",
+            "reason": "checkup",
+        })
+
+        self.assertContains(response, "already booked")
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class AppointmentQueryPlanTests(TestCase):
+    """
+    EXPLAIN the main appointment queries against a seeded table and fail
+    if the planner falls back to scanning the whole table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = User.objects.bulk_create(
+            User(username=f"doc{n}", role="doctor") for n in range(20)
+        )
+        cls.patients = User.objects.bulk_create(
+            User(username=f"pat{n}", role="patient") for n in range(200)
+        )
+        statuses = ["requested", "approved", "completed", "cancelled", "rejected", "missed"]
+        start = date(2030, 1, 1)
+        Appointment.objects.bulk_create(
+            Appointment(
+                patient=cls.patients[n % len(cls.patients)],
+                doctor=cls.doctors[n % len(cls.doctors)],
+                appointment_date=start + timedelta(days=n // 400),
+                appointment_time=SLOT_TIMES[(n // len(cls.doctors)) % len(SLOT_TIMES)],
+                status=statuses[n % len(statuses)],
+            )
+            for n in range(8000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        cls.day = start + timedelta(days=10)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = Appointment._meta.db_table
+        if connection.vendor == "postgresql":
+            self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+        else:
+            self.assertNotRegex(plan, rf"SCAN {table}\b", plan)
+
+    def test_doctor_queries(self):
+        doctor = self.doctors[3]
+        self.assertUsesIndex(Appointment.objects.filter(
+            doctor=doctor, appointment_date__gte=self.day
+        ).order_by("-appointment_date", "-appointment_time"))
+        self.assertUsesIndex(Appointment.objects.filter(doctor=doctor, status="missed"))
+        self.assertUsesIndex(Appointment.objects.filter(
+            doctor=doctor, appointment_date=self.day
+        ).exclude(status="cancelled"))
+
+    def test_patient_queries(self):
+        patient = self.patients[7]
+        self.assertUsesIndex(Appointment.objects.filter(patient=patient).order_by("-created_at"))
+        self.assertUsesIndex(Appointment.objects.filter(
+            patient=patient,
+            status__in=["approved", "completed"],
+            appointment_date__lt=self.day,
+        ).order_by("-appointment_date", "-appointment_time"))
+        self.assertUsesIndex(Appointment.objects.filter(
+            patient__in=self.patients[:3],
+            appointment_date__gte=self.day,
+            appointment_date__lte=self.day + timedelta(days=7),
+        ).order_by("appointment_date"))
+
+
+class ReviewPanelTests(DoctorPatientMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        start = date(2030, 1, 1)
+        Appointment.objects.bulk_create(
+            Appointment(
+                patient=cls.patient,
+                doctor=cls.doctor,
+                appointment_date=start + timedelta(days=n),
+                appointment_time=time(9, 0),
+                status="completed",
+            )
+            for n in range(25)
+        )
+        cls.appt = cls.create_appointment(start + timedelta(days=60), status="approved")
+
+    def setUp(self):
+        self.client.force_login(self.doctor)
+
+    def test_review_page_does_not_load_panels(self):
+        response = self.client.get(reverse("appointments:doctor_review", args=[self.appt.pk]))
+        self.assertNotIn("history", response.context)
+        self.assertContains(response, reverse("appointments:doctor_review_history", args=[self.appt.pk]))
+
+    def test_history_is_paginated(self):
+        url = reverse("appointments:doctor_review_history", args=[self.appt.pk])
+
+        first = self.client.get(url)
+        self.assertEqual(len(first.context["history"]), views.REVIEW_PAGE_SIZE)
+        self.assertEqual(first.context["history"][0].appointment_date, date(2030, 1, 25))
+        self.assertContains(first, "?page=2")
+
+        last = self.client.get(url, {"page": 3})
+        self.assertEqual(len(last.context["history"]), 5)
+        self.assertIsNone(last.context["next_page"])
+
+    def test_documents_panel_empty(self):
+        response = self.client.get(reverse("appointments:doctor_review_documents", args=[self.appt.pk]))
+        self.assertContains(response, "No documents uploaded.")
+
+    def test_other_doctor_cannot_load_panels(self):
+        other = User.objects.create_user(username="doc2", password="x", role="doctor")
+        self.client.force_login(other)
+        response = self.client.get(reverse("appointments:doctor_review_history", args=[self.appt.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkActionTests(DoctorPatientMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.day = timezone.localdate() + timedelta(days=3)
+
+    def setUp(self):
+        self.client.force_login(self.doctor)
+
+    def book(self, at, status="requested", days=0):
+        return self.create_appointment(self.day + timedelta(days=days), at, status)
+
+    def post(self, ids, action, **offset):
+        response = self.client.post(
+            reverse("appointments:doctor_bulk"),
+            {"ids": ids, "action": action, **offset},
+        )
+        return {result["id"]: result for result in response.json()["results"]}
+
+    def test_approve_reports_per_row(self):
+        requested = self.book(time(9, 0))
+        completed = self.book(time(10, 0), status="completed")
+
+        results = self.post([requested.pk, completed.pk], "approve")
+
+        self.assertTrue(results[requested.pk]["ok"])
+        self.assertFalse(results[completed.pk]["ok"])
+        requested.refresh_from_db()
+        self.assertEqual(requested.status, "approved")
+
+    def test_reschedule_by_offset_checks_slots(self):
+        first = self.book(time(9, 0))
+        second = self.book(time(9, 15))
+        cascade = self.book(time(11, 30))
+        blocked = self.book(time(11, 45))
+        self.book(time(12, 0), status="approved")   # not selected
+        late = self.book(time(20, 0))
+
+        results = self.post(
+            [first.pk, second.pk, cascade.pk, blocked.pk, late.pk], "reschedule", minutes=15
+        )
+
+        # The 9:00 / 9:15 chain moves together; 12:00 is held by a row that
+        # is not moving, so 11:45 stays, and so does 11:30 behind it;
+        # 20:00 -> 20:15 is after hours
+        self.assertTrue(results[first.pk]["ok"])
+        self.assertTrue(results[second.pk]["ok"])
+        self.assertFalse(results[cascade.pk]["ok"])
+        self.assertFalse(results[blocked.pk]["ok"])
+        self.assertFalse(results[late.pk]["ok"])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.appointment_time, first.status), (time(9, 15), "approved"))
+        self.assertEqual((second.appointment_time, second.status), (time(9, 30), "approved"))
+
+        free = get_free_slots(self.doctor, self.day, self.day, now=timezone.make_aware(datetime(2000, 1, 1)))
+        self.assertIn(time(9, 0), free[self.day])
+        self.assertNotIn(time(9, 15), free[self.day])
+        self.assertNotIn(time(9, 30), free[self.day])
+
+    @override_settings(CACHES=DATABASE_CACHE)
+    def test_reschedule_reads_availability_once(self):
+        appts = [self.book(time(8 + n // 4, n % 4 * 15)) for n in range(20)]
+        cache.clear()
+        get_availability([self.doctor.pk])
+
+        with CaptureQueriesContext(connection) as ctx:
+            results = self.post([appt.pk for appt in appts], "reschedule", days=1)
+
+        self.assertTrue(all(result["ok"] for result in results.values()))
+        reads = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT") and "meditracker_cache" in q["sql"]]
+        self.assertEqual(len(reads), 1)
+
+    def test_reschedule_reports_slot_lost_to_concurrent_booking(self):
+        appt = self.book(time(10, 0))
+        self.book(time(10, 15), status="approved")
+        real = services._booked_slots
+
+        # The clash check misses the 10:15 booking once, as if it committed just after
+        with mock.patch.object(services, "_booked_slots", side_effect=[{}, real(self.doctor, {self.day})]):
+            results = self.post([appt.pk], "reschedule", minutes=15)
+
+        self.assertEqual(results[appt.pk]["error"], services.SLOT_TAKEN)
+        appt.refresh_from_db()
+        self.assertEqual((appt.appointment_time, appt.status), (time(10, 0), "requested"))
+
+    def test_other_doctors_rows_are_not_found(self):
+        other = User.objects.create_user(username="doc2", password="x", role="doctor")
+        appt = Appointment.objects.create(
+            patient=self.patient,
+            doctor=other,
+            appointment_date=self.day,
+            appointment_time=time(9, 0),
+        )
+
+        results = self.post([appt.pk], "reject")
+
+        self.assertFalse(results[appt.pk]["ok"])
+        appt.refresh_from_db()
+        self.assertEqual(appt.status, "requested")
+
+
+class ExpireStaleRequestsTests(DoctorPatientMixin, TestCase):
+
+    def test_only_past_requests_are_expired(self):
+        today = date(2030, 5, 6)
+
+        def book(days, status):
+            return self.create_appointment(today + timedelta(days=days), status=status)
+
+        stale = [book(-1, "requested"), book(-3, "requested")]
+        upcoming = book(0, "requested")
+        approved = book(-2, "approved")
+
+        self.assertEqual(expire_stale_requests(today=today, chunk_size=1), 2)
+        self.assertEqual(expire_stale_requests(today=today), 0)
+
+        statuses = dict(Appointment.objects.values_list("pk", "status"))
+        self.assertEqual([statuses[appt.pk] for appt in stale], ["missed", "missed"])
+        self.assertEqual(statuses[upcoming.pk], "requested")
+        self.assertEqual(statuses[approved.pk], "approved")
+
+
+class CalendarFeedTests(DoctorPatientMixin, TestCase):
+
+    doctor_first_name = "Ann"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.appt = cls.create_appointment(
+            timezone.localdate() + timedelta(days=2),
+            reason="Check-up, bloods; fasting",
+            status="approved",
+        )
+
+    def feed_url(self, user):
+        self.client.force_login(user)
+        self.client.post(reverse("appointments:calendar_reset"))
+        self.client.logout()
+        return CalendarFeed.objects.get(user=user).get_absolute_url()
+
+    def test_patient_feed(self):
+        response = self.client.get(self.feed_url(self.patient))
+
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertIn(f"UID:appointment-{self.appt.pk}@", body)
+        self.assertIn("SUMMARY:Appointment with Dr. Ann", body)
+        self.assertIn("DESCRIPTION:Check-up\\, bloods\\; fasting", body)
+        self.assertIn("STATUS:CONFIRMED", body)
+        self.assertTrue(body.endswith("END:VCALENDAR\r\n"))
+
+    def test_conditional_get(self):
+        url = self.feed_url(self.doctor)
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.appt.status = "cancelled"
+        self.appt.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("STATUS:CANCELLED", b"".join(response.streaming_content).decode())
+
+    def test_partial_saves_change_the_version(self):
+        url = self.feed_url(self.patient)
+        etag = self.client.get(url)["ETag"]
+
+        self.client.force_login(self.patient)
+        self.client.post(reverse("appointments:cancel", args=[self.appt.pk]))
+        self.client.logout()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        self.client.force_login(self.doctor)
+        self.client.post(
+            reverse("appointments:doctor_reschedule", args=[self.appt.pk]),
+            {
+                "appointment_date": (timezone.localdate() + timedelta(days=3)).isoformat(),
+                "appointment_time": "10:00",
+            },
+        )
+        self.client.logout()
+
+        self.appt.refresh_from_db()
+        self.assertEqual((self.appt.appointment_time, self.appt.status), (time(10, 0), "approved"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_reset_revokes_old_link(self):
+        old = self.feed_url(self.patient)
+        new = self.feed_url(self.patient)
+
+        self.assertNotEqual(old, new)
+        self.assertEqual(self.client.get(old).status_code, 404)
+
+
+class FollowUpLinkTests(DoctorPatientMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.today = timezone.localdate()
+
+    def book(self, days, status="approved", **kwargs):
+        return self.create_appointment(self.today + timedelta(days=days), status=status, **kwargs)
+
+    def test_review_links_and_copies_notes(self):
+        visit = self.book(0)
+        follow_up = self.book(14, status="requested")
+        self.client.force_login(self.doctor)
+
+        self.client.post(reverse("appointments:doctor_review", args=[visit.pk]), {
+            "doctor_notes": "Recheck blood pressure",
+            "follow_up_date": follow_up.appointment_date.isoformat(),
+            "action": "complete",
+        })
+
+        follow_up.refresh_from_db()
+        self.assertEqual(follow_up.follow_up_of_id, visit.pk)
+        self.assertEqual(follow_up.doctor_notes, "Recheck blood pressure")
+
+        with self.assertNumQueries(3):  # session, user, appointment + joins
+            response = self.client.get(reverse("appointments:doctor_review", args=[follow_up.pk]))
+        self.assertEqual(response.context["previous_followup"], visit)
+
+    def test_booking_on_follow_up_date_is_linked(self):
+        visit = self.book(-7, status="completed", follow_up_date=self.today + timedelta(days=7))
+        self.client.force_login(self.patient)
+
+        self.client.post(reverse("appointments:request"), {
+            "doctor": self.doctor.pk,
+            "appointment_date": visit.follow_up_date.isoformat(),
+            "appointment_time": "10:00",
+            "reason": "follow-up",
+        })
+
+        booking = Appointment.objects.get(reason="follow-up")
+        self.assertEqual(booking.follow_up_of, visit)
+
+
+# Query budgets count database work only, so the cache is kept in memory
+@override_settings(CACHES=LOCMEM_CACHE)
+class EarliestSlotSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = User.objects.bulk_create(
+            User(username=f"doc{n}", role="doctor") for n in range(300)
+        )
+        cls.patient = User.objects.create_user(username="pat", password="x", role="patient")
+        cls.day = date(2030, 5, 6)
+        cls.now = timezone.make_aware(datetime(2030, 5, 6, 8, 50))
+
+        # Every doctor is booked at 9:00; all but the last one at 9:15 too
+        masks = {doctor.pk: 1 << SLOT_TIMES.index(time(9, 0)) for doctor in cls.doctors}
+        for doctor in cls.doctors[:-1]:
+            masks[doctor.pk] |= 1 << SLOT_TIMES.index(time(9, 15))
+        DoctorDaySlots.objects.bulk_create(
+            DoctorDaySlots(doctor_id=pk, date=cls.day, booked=mask) for pk, mask in masks.items()
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHES=DATABASE_CACHE)
+    def test_cold_database_cache_is_filled_in_one_write(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            find_earliest_slots(self.day, self.day, limit=1, now=self.now)
+        writes = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT INTO")]
+        self.assertEqual(len(writes), 1)
+        self.assertLess(len(ctx.captured_queries), 15)
+
+    def test_earliest_slot_in_two_queries(self):
+        # Cold cache: working hours and exceptions of all doctors in two more queries
+        with self.assertNumQueries(4):
+            find_earliest_slots(self.day, self.day, limit=1, now=self.now)
+
+        with self.assertNumQueries(2):
+            slots = find_earliest_slots(self.day, self.day + timedelta(days=6), limit=2, now=self.now)
+
+        self.assertEqual(slots[0], (self.day, time(9, 15), [self.doctors[-1].pk]))
+        self.assertEqual(slots[1][1], time(9, 30))
+        self.assertEqual(len(slots[1][2]), 300)
+
+    def test_time_window_and_lunch(self):
+        slots = find_earliest_slots(
+            self.day, self.day, time_from=time(12, 50), time_to=time(14, 0), limit=10, now=self.now,
+        )
+        self.assertEqual([at for _, at, _ in slots], [time(14, 0)])
+
+    def test_api(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse("appointments:earliest_slots"), {"limit": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["slots"]), 3)
+
+    def test_api_rejects_impossible_date(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse("appointments:earliest_slots"), {"end": "2030-02-30"})
+        self.assertEqual(response.status_code, 400)
+
+
+# Query budgets count database work only, so the cache is kept in memory
+@override_settings(CACHES=LOCMEM_CACHE)
+class WorkingHoursTests(DoctorPatientMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(username="doc2", password="x", role="doctor")
+        cls.monday = date(2030, 5, 6)
+        cls.now = timezone.make_aware(datetime(2030, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        WorkingHours.objects.create(doctor=self.doctor, weekday=0, start_time=time(9, 0), end_time=time(10, 0))
+
+    def free(self, day):
+        return get_free_slots(self.doctor, day, day, now=self.now).get(day, [])
+
+    def test_weekly_template(self):
+        self.assertEqual(self.free(self.monday), [time(9, 0), time(9, 15), time(9, 30), time(9, 45)])
+        self.assertEqual(self.free(self.monday + timedelta(days=1)), [])
+
+        # Doctors without hours keep the clinic default
+        default = get_free_slots(self.other, self.monday, self.monday, now=self.now)[self.monday]
+        self.assertEqual(len(default), bin(WORKING_MASK).count("1"))
+
+    def test_exceptions_recompile_the_cached_mask(self):
+        self.free(self.monday)
+        with self.assertNumQueries(1):
+            self.free(self.monday)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AvailabilityException.objects.create(
+                doctor=self.doctor, date=self.monday, start_time=time(9, 0), end_time=time(9, 30),
+            )
+            AvailabilityException.objects.create(
+                doctor=self.doctor, date=self.monday, start_time=time(16, 0), end_time=time(16, 15), is_available=True,
+            )
+        self.assertEqual(self.free(self.monday), [time(9, 30), time(9, 45), time(16, 0)])
+
+        next_monday = self.monday + timedelta(days=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            AvailabilityException.objects.create(doctor=self.doctor, date=next_monday, reason="Holiday")
+        self.assertEqual(self.free(next_monday), [])
+
+    def test_booking_outside_hours_is_rejected(self):
+        self.client.force_login(self.patient)
+
+        response = self.client.post(reverse("appointments:request"), {
+            "doctor": self.doctor.pk,
+            "appointment_date": self.monday.isoformat(),
+            "appointment_time": "11:00",
+            "reason": "checkup",
+        })
+
+        self.assertContains(response, "The doctor is not available at this time.")
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_earliest_search_uses_each_doctors_hours(self):
+        slots = find_earliest_slots(self.monday, self.monday, time_from=time(9, 0), limit=1, now=self.now)
+        self.assertEqual(slots, [(self.monday, time(9, 0), [self.doctor.pk, self.other.pk])])
+
+        slots = find_earliest_slots(self.monday, self.monday, time_from=time(10, 0), limit=1, now=self.now)
+        self.assertEqual(slots, [(self.monday, time(10, 0), [self.other.pk])])
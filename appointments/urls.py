@@ -8,11 +8,19 @@ urlpatterns = [
     path("patient/", views.patient_appointments, name="patient_list"),
     path("patient/request/", views.request_appointment, name="request"),
     path("patient/<int:pk>/cancel/", views.cancel_appointment, name="cancel"),
+    path("doctor/<int:doctor_id>/free-slots/", views.free_slots, name="free_slots"),
+    path("earliest-slots/", views.earliest_slots, name="earliest_slots"),
 
   
     path("doctor/", views.doctor_appointments, name="doctor_list"),
+    path("doctor/bulk/", views.bulk_appointment_action, name="doctor_bulk"),
     path("doctor/<int:pk>/edit/", views.update_appointment, name="doctor_edit"),
     path("doctor/<int:pk>/review/", views.review_appointment, name="doctor_review"),
+    path("doctor/<int:pk>/review/history/", views.review_history, name="doctor_review_history"),
+    path("doctor/<int:pk>/review/documents/", views.review_documents, name="doctor_review_documents"),
     path("doctor/<int:pk>/details/", views.appointment_details, name="doctor_details"),
     path("doctor/<int:pk>/reschedule/", views.reschedule_appointment, name="doctor_reschedule"),
+
+    path("calendar/reset/", views.reset_calendar_feed, name="calendar_reset"),
+    path("calendar/<str:token>.ics", views.calendar_feed, name="calendar_feed"),
 ]
\ No newline at end of file
@@ -1,8 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from core.decorators import role_required
 from django.contrib import messages
-from .models import Appointment
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_time
+from .models import Appointment, CalendarFeed
+from .ics import feed_appointments, feed_version, iter_ics
 from .forms import AppointmentRequestForm, AppointmentDoctorUpdateForm
+from .availability import check_slot, find_earliest_slots, get_free_slots
+from .services import BULK_ACTIONS, apply_bulk_action, link_follow_up, save_booking, set_follow_up
 from django.utils import timezone
 from datetime import timedelta
 from datetime import datetime
@@ -21,7 +30,10 @@ def patient_appointments(request):
     return render(
         request,
         "appointments/patient_list.html",
-        {"appointments": appointments}
+        {
+            "appointments": appointments,
+            "calendar_url": calendar_feed_url(request),
+        }
     )
 
 
@@ -34,40 +46,13 @@ def request_appointment(request):
             appt = form.save(commit=False)
             appt.patient = request.user
 
-            selected_time = appt.appointment_time
-
-            # ✅ Doctor working hours check (7 AM – 8 PM)
-            if selected_time < time(7, 0) or selected_time > time(20, 0):
-                messages.error(
-                    request,
-                    "Appointments can only be booked between 7:00 AM and 8:00 PM."
-                )
-                return render(
-                    request,
-                    "appointments/form.html",
-                    {"form": form, "title": "Request Appointment"}
-                )
-
-            # ✅ Lunch break check (1 PM – 2 PM)
-            if time(13, 0) <= selected_time < time(14, 0):
-                messages.error(
-                    request,
-                    "Doctor is unavailable between 1:00 PM and 2:00 PM (Lunch Break)."
-                )
-                return render(
-                    request,
-                    "appointments/form.html",
-                    {"form": form, "title": "Request Appointment"}
-                )
-
-            # ✅ Check if slot already booked
-            slot_exists = Appointment.objects.filter(
-                doctor=appt.doctor,
-                appointment_date=appt.appointment_date,
-                appointment_time=appt.appointment_time
-            ).exists()
+            # ✅ Working hours / lunch / holidays were checked by the form;
+            # the unique_booked_doctor_slot constraint rejects the slot if
+            # another patient booked it first
+            appt.status = "requested"
+            link_follow_up(appt)
 
-            if slot_exists:
+            if not save_booking(appt):
                 messages.error(
                     request,
                     "This slot is already booked by another patient."
@@ -78,10 +63,6 @@ def request_appointment(request):
                     {"form": form, "title": "Request Appointment"}
                 )
 
-            # Save appointment
-            appt.status = "requested"
-            appt.save()
-
             messages.success(request, "Appointment requested successfully.")
             return redirect("appointments:patient_list")
 
@@ -95,6 +76,64 @@ def request_appointment(request):
     )
 
 
+@login_required
+def free_slots(request, doctor_id):
+    """
+    Free 15-minute slots of one doctor for a date range, from the
+    precomputed DoctorDaySlots grid.
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (defaults to the next 7 days, max 31)
+    """
+    from accounts.models import User
+
+    doctor = get_object_or_404(User, pk=doctor_id, role="doctor")
+
+    today = timezone.localdate()
+    try:
+        start = max(parse_date(request.GET.get("start") or "") or today, today)
+        end = parse_date(request.GET.get("end") or "") or start + timedelta(days=6)
+    except ValueError:
+        return JsonResponse({"error": "Invalid start or end date."}, status=400)
+    end = min(end, start + timedelta(days=30))
+
+    slots = get_free_slots(doctor, start, end)
+
+    return JsonResponse({
+        "doctor": doctor.pk,
+        "slots": {
+            day.isoformat(): [slot.strftime("%H:%M") for slot in times]
+            for day, times in slots.items()
+        },
+    })
+
+
+@login_required
+def earliest_slots(request):
+    """
+    Earliest free slots across all doctors.
+    ?start=&end=YYYY-MM-DD (default the next 14 days, max 31)
+    &from=&to=HH:MM (time-of-day window) &limit= (default 10, max 50)
+    """
+    today = timezone.localdate()
+    try:
+        start = max(parse_date(request.GET.get("start") or "") or today, today)
+        end = parse_date(request.GET.get("end") or "") or start + timedelta(days=13)
+        limit = min(max(int(request.GET.get("limit") or 10), 1), 50)
+        time_from = parse_time(request.GET.get("from") or "")
+        time_to = parse_time(request.GET.get("to") or "")
+    except ValueError:
+        return JsonResponse({"error": "Invalid date, limit or time."}, status=400)
+    end = min(end, start + timedelta(days=30))
+
+    slots = find_earliest_slots(start, end, time_from=time_from, time_to=time_to, limit=limit)
+
+    return JsonResponse({
+        "slots": [
+            {"date": day.isoformat(), "time": at.strftime("%H:%M"), "doctors": doctors}
+            for day, at, doctors in slots
+        ],
+    })
+
+
 @role_required("patient")
 def cancel_appointment(request, pk):
     appt = get_object_or_404(
@@ -138,11 +177,10 @@ def doctor_appointments(request):
         "-appointment_time"
     )
 
-    # ✅ Missed Count
+    # ✅ Missed Count (stored by expire_appointment_requests)
     missed_count = Appointment.objects.filter(
         doctor=request.user,
-        status="requested",
-        appointment_date__lt=today
+        status="missed"
     ).count()
 
     return render(
@@ -152,10 +190,37 @@ def doctor_appointments(request):
             "appointments": appointments,
             "today": today,
             "missed_count": missed_count,  # 🔥 send to template
+            "calendar_url": calendar_feed_url(request),
         }
     )
 
 
+@require_POST
+@role_required("doctor")
+def bulk_appointment_action(request):
+    """Approve / reject / complete / reschedule-by-offset many appointments."""
+    action = request.POST.get("action")
+    if action not in BULK_ACTIONS:
+        return JsonResponse({"error": "Unknown action."}, status=400)
+
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in request.POST.getlist("ids")))
+        days = int(request.POST.get("days") or 0)
+        minutes = int(request.POST.get("minutes") or 0)
+    except ValueError:
+        return JsonResponse({"error": "Invalid ids or offset."}, status=400)
+
+    if not ids:
+        return JsonResponse({"error": "No appointments selected."}, status=400)
+
+    results = apply_bulk_action(request.user, ids, action, days=days, minutes=minutes)
+
+    return JsonResponse({
+        "results": results,
+        "updated": sum(result["ok"] for result in results),
+    })
+
+
 @role_required("doctor")
 def update_appointment(request, pk):
     appt = get_object_or_404(
@@ -170,8 +235,9 @@ def update_appointment(request, pk):
             instance=appt
         )
         if form.is_valid():
-            form.save()
-            return redirect("appointments:doctor_list")
+            if save_booking(form.instance):
+                return redirect("appointments:doctor_list")
+            messages.error(request, "This slot is already booked by another patient.")
     else:
         form = AppointmentDoctorUpdateForm(instance=appt)
 
@@ -195,7 +261,7 @@ from .models import Appointment
 @role_required("doctor")
 def review_appointment(request, pk):
     appt = get_object_or_404(
-        Appointment,
+        Appointment.objects.select_related("patient", "follow_up_of"),
         pk=pk,
         doctor=request.user
     )
@@ -208,25 +274,6 @@ def review_appointment(request, pk):
         appt.status == "approved"
     )
 
-    # ✅ FIXED HISTORY QUERY
-    history = Appointment.objects.filter(
-        patient=appt.patient,
-        status__in=["approved", "completed"],
-        appointment_date__lt=appt.appointment_date
-    ).exclude(
-        pk=appt.pk
-    ).order_by(
-        "-appointment_date",
-        "-appointment_time"
-    )
-
-    from documents.models import MedicalDocument
-
-    documents = MedicalDocument.objects.filter(
-        patient=appt.patient,
-        is_active=True
-    ).order_by("-uploaded_at")
-
     # ================= POST LOGIC =================
     if request.method == "POST":
 
@@ -253,23 +300,15 @@ def review_appointment(request, pk):
                 follow_up, "%Y-%m-%d"
             ).date()
 
-            appt.follow_up_date = follow_up_date_obj
+            next_appt = set_follow_up(appt, follow_up_date_obj)
 
             # ✅ AUTO COPY NOTES TO FOLLOW-UP APPOINTMENT
-            if notes and notes.strip() != "":
-                next_appt = Appointment.objects.filter(
-                    patient=appt.patient,
-                    appointment_date=follow_up_date_obj
-                ).exclude(
-                    pk=appt.pk
-                ).first()
-
-                if next_appt:
-                    next_appt.doctor_notes = notes
-                    next_appt.save(update_fields=["doctor_notes"])
+            if notes and notes.strip() != "" and next_appt:
+                next_appt.doctor_notes = notes
+                next_appt.save(update_fields=["doctor_notes"])
 
         elif can_modify:
-            appt.follow_up_date = None
+            set_follow_up(appt, None)
 
         # Actions
         if action == "approve":
@@ -286,28 +325,94 @@ def review_appointment(request, pk):
         messages.success(request, "Appointment updated successfully.")
         return redirect("appointments:doctor_list")
 
-    
-    previous_followup = Appointment.objects.filter(
-        patient=appt.patient,
-        follow_up_date=appt.appointment_date,
-        status="completed"
-    ).exclude(
-        pk=appt.pk
-    ).order_by("-appointment_date").first()
+    # Loaded with the appointment through the follow_up_of join
+    previous_followup = appt.follow_up_of
+    if previous_followup and previous_followup.status != "completed":
+        previous_followup = None
 
     return render(
         request,
         "doctor/appointment_review.html",
         {
             "appointment": appt,
-            "history": history,
-            "documents": documents,
             "can_modify": can_modify,
             "previous_followup": previous_followup,   
             "today": today,
         }
     )
 
+# History and documents panels of the review page are loaded lazily,
+# one page at a time
+REVIEW_PAGE_SIZE = 10
+
+
+def _fragment_page(request, queryset):
+    """Slices one page (plus one row to detect more) without a COUNT query."""
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+
+    offset = (page - 1) * REVIEW_PAGE_SIZE
+    rows = list(queryset[offset:offset + REVIEW_PAGE_SIZE + 1])
+    next_page = page + 1 if len(rows) > REVIEW_PAGE_SIZE else None
+    return rows[:REVIEW_PAGE_SIZE], page, next_page
+
+
+@role_required("doctor")
+def review_history(request, pk):
+    appt = get_object_or_404(
+        Appointment,
+        pk=pk,
+        doctor=request.user
+    )
+
+    history = Appointment.objects.filter(
+        patient_id=appt.patient_id,
+        status__in=["approved", "completed"],
+        appointment_date__lt=appt.appointment_date
+    ).exclude(
+        pk=appt.pk
+    ).order_by(
+        "-appointment_date",
+        "-appointment_time"
+    ).only("appointment_date", "status")
+
+    history, page, next_page = _fragment_page(request, history)
+
+    return render(
+        request,
+        "doctor/review_history.html",
+        {"appointment": appt, "history": history, "page": page, "next_page": next_page}
+    )
+
+
+@role_required("doctor")
+def review_documents(request, pk):
+    appt = get_object_or_404(
+        Appointment,
+        pk=pk,
+        doctor=request.user
+    )
+
+    from documents.models import MedicalDocument
+
+    documents = MedicalDocument.objects.filter(
+        patient_id=appt.patient_id,
+        is_active=True
+    ).order_by("-uploaded_at", "-id").only(
+        "title", "document_type", "file", "uploaded_at"
+    )
+
+    documents, page, next_page = _fragment_page(request, documents)
+
+    return render(
+        request,
+        "doctor/review_documents.html",
+        {"appointment": appt, "documents": documents, "page": page, "next_page": next_page}
+    )
+
+
 @role_required("doctor")
 def appointment_details(request, pk):
     appt = get_object_or_404(
@@ -361,12 +466,9 @@ def reschedule_appointment(request, pk):
         hour, minute = map(int, new_time.split(":"))
         selected_time = time(hour, minute)
 
-        if selected_time < time(7, 0) or selected_time > time(20, 0):
-            messages.error(request, "Time must be between 7:00 AM and 8:00 PM.")
-            return redirect("appointments:doctor_reschedule", pk=appt.pk)
-
-        if minute not in [0, 15, 30, 45]:
-            messages.error(request, "Time must be in 15 minute intervals.")
+        slot_error = check_slot(request.user.pk, new_date_obj, selected_time)
+        if slot_error:
+            messages.error(request, slot_error)
             return redirect("appointments:doctor_reschedule", pk=appt.pk)
 
         # ---------------- SAVE ----------------
@@ -374,11 +476,13 @@ def reschedule_appointment(request, pk):
         appt.appointment_time = selected_time
         appt.status = "approved"
 
-        appt.save(update_fields=[
+        if not save_booking(appt, update_fields=[
             "appointment_date",
             "appointment_time",
             "status"
-        ])
+        ]):
+            messages.error(request, "This slot is already booked by another patient.")
+            return redirect("appointments:doctor_reschedule", pk=appt.pk)
 
         messages.success(request, "Appointment rescheduled successfully.")
         return redirect("appointments:doctor_list")
@@ -390,4 +494,54 @@ def reschedule_appointment(request, pk):
             "appointment": appt,
             "today": today,
         }
-    )
\ No newline at end of file
+    )
+
+# =====================================================
+# CALENDAR FEEDS
+# =====================================================
+def calendar_feed_url(request):
+    feed = CalendarFeed.objects.filter(user=request.user).only("token").first()
+    return request.build_absolute_uri(feed.get_absolute_url()) if feed else None
+
+
+@login_required
+@require_POST
+def reset_calendar_feed(request):
+    """Creates the user's feed link, or replaces it (revoking the old one)."""
+    feed = CalendarFeed.objects.filter(user=request.user).first() or CalendarFeed(user=request.user)
+    feed.rotate()
+    feed.save()
+
+    if request.user.role == "doctor":
+        return redirect("appointments:doctor_list")
+    return redirect("appointments:patient_list")
+
+
+def calendar_feed(request, token):
+    """
+    Public ICS feed; the token is the credential. Answers 304 from one
+    aggregate query when the client's ETag / Last-Modified still match.
+    """
+    feed = get_object_or_404(CalendarFeed.objects.select_related("user"), token=token)
+
+    today = timezone.localdate()
+    appointments = feed_appointments(feed.user, today=today)
+    latest, count = feed_version(appointments)
+
+    # The date is part of the tag because old appointments leave the window daily
+    etag = quote_etag(f"{count}-{latest.timestamp() if latest else 0}-{today.isoformat()}")
+    last_modified = int(latest.timestamp()) if latest else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(
+            iter_ics(feed.user, appointments, request.get_host()),
+            content_type="text/calendar; charset=utf-8",
+        )
+        response["Content-Disposition"] = 'inline; filename="appointments.ics"'
+
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
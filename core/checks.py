@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+}
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached dashboard counters and doctor availability are invalidated
+    through the default cache, which every worker must share.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+
+    return [
+        Warning(
+            "The default cache is local to each process.",
+            hint=(
+                "Invalidations only reach the worker that made them, so other "
+                "workers serve stale dashboard counters and doctor availability. "
+                "Configure a shared cache (database, Redis or Memcached)."
+            ),
+            id="core.W001",
+        )
+    ]
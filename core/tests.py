@@ -1,3 +1,98 @@
-from django.test import TestCase
+from datetime import time, timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointment
+from .checks import check_shared_cache
+
+User = get_user_model()
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+# Query budgets below count database work only, so the cache is kept in memory
+@override_settings(CACHES=LOCMEM_CACHE)
+class DoctorDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username="doc", password="x", role="doctor")
+        cls.patient = User.objects.create_user(username="pat", password="x", role="patient")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.doctor)
+
+    def book(self, days, at, status):
+        return Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.localdate() + timedelta(days=days),
+            appointment_time=at,
+            status=status,
+        )
+
+    def counters(self):
+        response = self.client.get(reverse("core:doctor_dashboard"))
+        return {key: response.context[key] for key in ("pending", "today", "approved", "missed")}
+
+    def test_counters_are_cached_and_invalidated(self):
+        self.book(0, time(9, 0), "approved")
+        self.book(1, time(9, 0), "requested")
+        self.book(-2, time(9, 0), "missed")
+        self.book(0, time(10, 0), "cancelled")
+
+        self.assertEqual(self.counters(), {"pending": 1, "today": 1, "approved": 1, "missed": 1})
+
+        # Session + user lookups only; the counters come from the cache
+        with self.assertNumQueries(2):
+            self.client.get(reverse("core:doctor_dashboard"))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book(0, time(11, 0), "requested")
+
+        # The cached counts are only dropped once the booking commits
+        self.assertEqual(self.counters()["pending"], 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.counters(), {"pending": 2, "today": 2, "approved": 1, "missed": 1})
+
+
+class ConfiguredCacheDashboardTests(TestCase):
+    """Runs against settings.CACHES as configured, not an in-memory override."""
+
+    def test_repeat_load_costs_one_cache_read_at_most(self):
+        doctor = User.objects.create_user(username="doc", password="x", role="doctor")
+        self.client.force_login(doctor)
+        cache.clear()
+        self.client.get(reverse("core:doctor_dashboard"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("core:doctor_dashboard"))
+
+        # Session + user lookups, plus the counters' own row for the database cache
+        cache_reads = 1 if isinstance(caches["default"], DatabaseCache) else 0
+        self.assertEqual(len(ctx.captured_queries), 2 + cache_reads)
+        self.assertFalse(any("appointments_appointment" in q["sql"] for q in ctx.captured_queries))
+
+
+class SharedCacheCheckTests(TestCase):
+
+    @override_settings(DEBUG=False, CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    })
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ["core.W001"])
+
+    @override_settings(DEBUG=False, CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "cache"},
+    })
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
@@ -1,9 +1,8 @@
 from datetime import timedelta
-from django.utils import timezone
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from core.decorators import role_required
-from appointments.models import Appointment
+from appointments.services import get_doctor_counters
 
 @login_required
 @role_required("patient")
@@ -15,36 +14,17 @@ def patient_dashboard(request):
 @role_required("doctor")
 def doctor_dashboard(request):
     doctor = request.user
-    today_date = timezone.localdate()
 
-    qs = Appointment.objects.filter(doctor=doctor)
-
-    # Pending (still requested & future/today)
-    pending = qs.filter(
-        status="requested",
-        appointment_date__gte=today_date
-    ).count()
-
-    # Today appointments (not cancelled)
-    today = qs.filter(
-        appointment_date=today_date
-    ).exclude(status="cancelled").count()
-
-    # ✅ MISSED = requested but date already gone
-    missed = qs.filter(
-        status="requested",
-        appointment_date__lt=today_date
-    ).count()
-
-    approved = qs.filter(status="approved").count()
+    # One aggregate query, cached per doctor until an appointment changes
+    counters = get_doctor_counters(doctor)
 
     unread_alerts = 0
 
     context = {
-        "pending": pending,
-        "today": today,
-        "approved": approved,
-        "missed": missed,
+        "pending": counters["pending"],
+        "today": counters["today"],
+        "approved": counters["approved"],
+        "missed": counters["missed"],
         "unread_alerts": unread_alerts,
     }
 
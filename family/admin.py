@@ -1,6 +1,8 @@
 # family/admin.py
 from django.contrib import admin
+from django.db import transaction
 from .models import FamilyPatientLink
+from .utils import invalidate_family_access
 
 class FamilyPatientLinkAdmin(admin.ModelAdmin):
     list_display = ("family_member", "patient", "relation", "status", "is_active")
@@ -9,6 +11,11 @@ class FamilyPatientLinkAdmin(admin.ModelAdmin):
     actions = ["approve_requests"]
 
     def approve_requests(self, request, queryset):
+        family_user_ids = set(queryset.values_list("family_member_id", flat=True))
         queryset.update(status="approved", is_active=True)
 
+        # .update() skips the post_save signal
+        for family_user_id in family_user_ids:
+            transaction.on_commit(lambda family_user_id=family_user_id: invalidate_family_access(family_user_id))
+
     approve_requests.short_description = "Approve selected dependent requests"
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FamilyConfig(AppConfig):
     name = 'family'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import FamilyPatientLink
+from .utils import invalidate_family_access
+
+
+@receiver(post_save, sender=FamilyPatientLink)
+@receiver(post_delete, sender=FamilyPatientLink)
+def drop_cached_family_access(sender, instance, **kwargs):
+    # After commit, so no request can re-cache the old set in between
+    family_user_id = instance.family_member_id
+    transaction.on_commit(lambda: invalidate_family_access(family_user_id))
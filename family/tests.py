@@ -1,3 +1,207 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from adherence.models import IntakeLog
+from appointments.models import Appointment
+from medicines.models import Medicine, Prescription, PrescriptionItem
+from patients.models import PatientProfile
+from schedules.models import MedicineSchedule
+from .models import FamilyPatientLink
+from .utils import _access_cache
+
+User = get_user_model()
+
+DATABASE_CACHE = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "meditracker_cache"}}
+
+
+class FamilyAdherenceInsightsTests(TestCase):
+
+    def setUp(self):
+        self.family = User.objects.create_user(username="fam", password="x", role="family")
+        self.client.force_login(self.family)
+
+    def add_dependent(self, username):
+        user = User.objects.create_user(username=username, password="x", role="patient")
+        profile = PatientProfile.objects.create(user=user)
+        FamilyPatientLink.objects.create(
+            family_member=self.family,
+            patient=profile,
+            status="approved",
+            is_active=True,
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("family:adherence_insights"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_dependents(self):
+        self.add_dependent("one")
+        baseline = self.count_queries()
+
+        for username in ("two", "three", "four"):
+            self.add_dependent(username)
+
+        self.assertEqual(self.count_queries(), baseline)
+
+
+class FamilyDashboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _access_cache.clear()
+
+        self.family = User.objects.create_user(username="fam", password="x", role="family")
+        self.doctor = User.objects.create_user(username="doc", password="x", role="doctor")
+        self.medicine = Medicine.objects.create(name="Paracetamol")
+        self.client.force_login(self.family)
+
+    def add_dependent(self, username, medicines=1, status="approved", appointment=True):
+        user = User.objects.create_user(username=username, password="x", role="patient")
+        profile = PatientProfile.objects.create(user=user)
+        FamilyPatientLink.objects.create(
+            family_member=self.family,
+            patient=profile,
+            status=status,
+            is_active=status == "approved",
+        )
+
+        if appointment:
+            Appointment.objects.create(
+                patient=user,
+                doctor=self.doctor,
+                appointment_date=date.today() + timedelta(days=1),
+                appointment_time=time(8 + PatientProfile.objects.count(), 0),
+                status="approved",
+            )
+        prescription = Prescription.objects.create(patient=user, doctor=self.doctor)
+        for _ in range(medicines):
+            item = PrescriptionItem.objects.create(
+                prescription=prescription, medicine=self.medicine, dose="1", frequency="OD"
+            )
+            MedicineSchedule.objects.create(
+                prescription_item=item, start_date=date.today(), time=time(8, 0)
+            )
+
+    def get_dashboard(self):
+        # session, user, links, upcoming appointments, medicine counts
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("family:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_budget_does_not_grow_with_dependents(self):
+        self.add_dependent("one")
+        self.get_dashboard()
+
+        for username in ("two", "three", "four", "five"):
+            self.add_dependent(username, medicines=2)
+        self.add_dependent("pending", status="pending")
+        self.add_dependent("rejected", status="rejected")
+        response = self.get_dashboard()
+
+        self.assertEqual(response.context["approved_count"], 5)
+        self.assertEqual(response.context["pending_count"], 1)
+        self.assertEqual(len(response.context["rejected_links"]), 1)
+        self.assertEqual(len(response.context["upcoming_appointments"]), 5)
+        self.assertEqual(response.context["today_medicines_count"], 9)
+
+    def test_today_doses_per_dependent(self):
+        self.add_dependent("one", medicines=3)
+        self.add_dependent("two", medicines=0)
+        self.add_dependent("pending", status="pending")
+
+        schedule = MedicineSchedule.objects.filter(
+            prescription_item__prescription__patient__username="one"
+        ).first()
+        IntakeLog.objects.create(
+            schedule=schedule,
+            patient=schedule.prescription_item.prescription.patient,
+            date=date.today(),
+            status="taken",
+        )
+
+        counts = {
+            link.patient.user.username: (link.doses_taken, link.doses_today)
+            for link in self.get_dashboard().context["links"]
+        }
+        self.assertEqual(counts, {"one": (1, 3), "two": (0, 0)})
+
+    def test_today_doses_page_budget_with_many_dependents(self):
+        for index in range(50):
+            self.add_dependent(f"dep{index}", appointment=False)
+        self.add_dependent("pending", status="pending", appointment=False)
+
+        # session, user, links, today's doses with their logs
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("family:today_doses"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["dependents"]), 50)
+        self.assertEqual(response.context["total_doses"], 50)
+        self.assertEqual(response.context["taken_doses"], 0)
+        self.assertContains(response, "Not logged", count=50)
+
+
+class FamilyAccessCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _access_cache.clear()
+
+        self.family = User.objects.create_user(username="fam", password="x", role="family")
+        self.patient = User.objects.create_user(username="pat", password="x", role="patient")
+        self.profile = PatientProfile.objects.create(user=self.patient)
+        self.link = FamilyPatientLink.objects.create(family_member=self.family, patient=self.profile)
+        self.url = reverse("family:patient_appointments", args=[self.profile.pk])
+
+    def link_queries(self):
+        self.client.force_login(self.family)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        queries = [q["sql"] for q in ctx.captured_queries if "family_familypatientlink" in q["sql"]]
+        return response.status_code, len(queries)
+
+    def approve(self):
+        self.client.force_login(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("patients:handle_dependent_request", args=[self.link.pk, "approve"]))
+
+    def test_access_is_resolved_once_and_cached(self):
+        self.approve()
+
+        # One lookup serves both checks in the view, then the LRU serves repeats
+        self.assertEqual(self.link_queries(), (200, 1))
+        self.assertEqual(self.link_queries(), (200, 0))
+
+    def test_approval_and_revocation_invalidate(self):
+        self.assertEqual(self.link_queries()[0], 403)
+
+        self.approve()
+        self.assertEqual(self.link_queries()[0], 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.delete()
+        self.assertEqual(self.link_queries()[0], 403)
+
+    @override_settings(CACHES=DATABASE_CACHE)
+    def test_revocation_reaches_other_workers(self):
+        cache.clear()
+        self.approve()
+        self.assertEqual(self.link_queries()[0], 200)
+        stale = _access_cache.get(self.family.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.delete()
+
+        # Another worker still holds the approved set in its own LRU; the
+        # version bumped in the shared cache makes it look the set up again
+        _access_cache.set(self.family.pk, stale)
+        self.assertEqual(self.link_queries(), (403, 1))
@@ -58,4 +58,5 @@ path(
     name="create_appointment",
 ),
 path("insights/", views.family_adherence_insights, name="adherence_insights"),
+path("today/", views.family_today_doses, name="today_doses"),
 ]
\ No newline at end of file
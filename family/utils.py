@@ -1,6 +1,99 @@
 # family/utils.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
 from .models import FamilyPatientLink
 
+# Approved patient sets are kept per process for this long. Invalidation
+# bumps a version in the shared cache, so other workers drop stale sets
+# on their next check instead of waiting for the TTL.
+FAMILY_ACCESS_TTL = 300
+FAMILY_ACCESS_MAXSIZE = 2048
+
+
+class TTLCache:
+    """Small thread-safe, process-local LRU whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_access_cache = TTLCache(FAMILY_ACCESS_MAXSIZE, FAMILY_ACCESS_TTL)
+
+
+def _version_key(family_user_id):
+    return f"family-access-version:{family_user_id}"
+
+
+def get_accessible_patient_ids(family_user):
+    """
+    PatientProfile ids the family member has approved, active links to.
+    Resolved once per user instance (i.e. per request), then served from
+    the process-local LRU while its version matches the shared cache.
+    """
+    ids = getattr(family_user, "_family_patient_ids", None)
+    if ids is not None:
+        return ids
+
+    version = cache.get(_version_key(family_user.pk), 0)
+    entry = _access_cache.get(family_user.pk)
+    if entry is not None and entry[0] == version:
+        ids = entry[1]
+    else:
+        ids = frozenset(
+            FamilyPatientLink.objects.filter(
+                family_member=family_user,
+                status="approved",
+                is_active=True
+            ).values_list("patient_id", flat=True)
+        )
+        _access_cache.set(family_user.pk, (version, ids))
+
+    family_user._family_patient_ids = ids
+    return ids
+
+
+def invalidate_family_access(family_user_id):
+    _access_cache.pop(family_user_id)
+    try:
+        cache.incr(_version_key(family_user_id))
+    except ValueError:
+        cache.set(_version_key(family_user_id), 1, None)
+
+
 def is_family_member(user):
     return user.is_authenticated and user.role == "family"
 
@@ -12,17 +105,7 @@ def family_has_access(user, patient):
     ).exists()
 
 def can_family_access_patient(family_user, patient_profile):
-    return FamilyPatientLink.objects.filter(
-        family_member=family_user,
-        patient=patient_profile,
-        status="approved",
-        is_active=True
-    ).exists()
+    return patient_profile.pk in get_accessible_patient_ids(family_user)
 
 def can_family_manage_appointments(family_user, patient_profile):
-    return FamilyPatientLink.objects.filter(
-        family_member=family_user,
-        patient=patient_profile,
-        status="approved",
-        is_active=True
-    ).exists()
\ No newline at end of file
+    return patient_profile.pk in get_accessible_patient_ids(family_user)
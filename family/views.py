@@ -8,6 +8,7 @@ from django.contrib import messages
 from django.http import HttpResponseForbidden
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.utils import timezone
 
 # ===============================
 # Core / utils
@@ -26,8 +27,9 @@ from patients.models import PatientProfile
 from medicines.models import Prescription
 from schedules.models import MedicineSchedule
 from appointments.models import Appointment
+from appointments.services import link_follow_up, save_booking
 from documents.models import MedicalDocument
-from adherence.services import get_adherence_stats
+from adherence.services import get_adherence_stats_bulk, get_today_doses
 from .models import FamilyPatientLink
 
 # ===============================
@@ -44,47 +46,43 @@ User = get_user_model()
 @role_required("family")
 def family_dashboard(request):
     # -------------------------------
-    # Approved dependents
+    # All links in one query, split by status
     # -------------------------------
-    approved_links = FamilyPatientLink.objects.filter(
-        family_member=request.user,
-        status="approved",
-        is_active=True
-    ).select_related("patient__user")
+    links = FamilyPatientLink.objects.filter(
+        family_member=request.user
+    ).select_related("patient__user").order_by("created_at")
 
-    patients = [link.patient.user for link in approved_links]
+    approved_links, pending_links, rejected_links = [], [], []
+    for link in links:
+        if link.status == "approved" and link.is_active:
+            approved_links.append(link)
+        elif link.status == "pending":
+            pending_links.append(link)
+        elif link.status == "rejected":
+            rejected_links.append(link)
 
-    # -------------------------------
-    # Pending requests (NEW)
-    # -------------------------------
-    pending_links = FamilyPatientLink.objects.filter(
-        family_member=request.user,
-        status="pending"
-    ).select_related("patient__user")
-       
-    rejected_links = FamilyPatientLink.objects.filter(
-        family_member=request.user,
-        status="rejected"
-    ).select_related("patient__user")
+    patient_user_ids = [link.patient.user_id for link in approved_links]
 
     # -------------------------------
     # Upcoming appointments (7 days)
     # -------------------------------
-    upcoming_appointments = Appointment.objects.filter(
-        patient__in=patients,
-        appointment_date__gte=date.today(),
-        appointment_date__lte=date.today() + timedelta(days=7),
-    ).order_by("appointment_date")[:5]
+    upcoming_appointments = list(
+        Appointment.objects.filter(
+            patient_id__in=patient_user_ids,
+            appointment_date__gte=date.today(),
+            appointment_date__lte=date.today() + timedelta(days=7),
+        ).select_related("patient").order_by("appointment_date", "appointment_time")[:5]
+    )
 
     # -------------------------------
-    # Today's medicines count
+    # Today's doses per dependent (one query)
     # -------------------------------
-    today_medicines_count = MedicineSchedule.objects.filter(
-        prescription_item__prescription__patient__in=patients,
-        is_active=True
-    ).count()
+    today_doses = get_today_doses(patient_user_ids)
 
-    
+    for link in approved_links:
+        doses = today_doses.get(link.patient.user_id, [])
+        link.doses_today = len(doses)
+        link.doses_taken = sum(1 for dose in doses if dose.status == "taken")
 
     # -------------------------------
     # Context
@@ -93,10 +91,10 @@ def family_dashboard(request):
         "links": approved_links,                 # existing usage
         "pending_links": pending_links,          # ✅ NEW (for UI)
         "rejected_links": rejected_links,
-        "approved_count": approved_links.count(),
-        "pending_count": pending_links.count(),
+        "approved_count": len(approved_links),
+        "pending_count": len(pending_links),
         "upcoming_appointments": upcoming_appointments,
-        "today_medicines_count": today_medicines_count,
+        "today_medicines_count": sum(len(doses) for doses in today_doses.values()),
     }
 
     return render(request, "family/dashboard.html", context)
@@ -280,9 +278,11 @@ def family_create_appointment(request, patient_id):
                 appt.patient = patient.user
                 appt.status = "requested"
                 appt.created_by_family = request.user
-                appt.save()
-                messages.success(request, "Appointment requested.")
-                return redirect("family:patient_appointments", patient_id=patient.id)
+                link_follow_up(appt)
+                if save_booking(appt):
+                    messages.success(request, "Appointment requested.")
+                    return redirect("family:patient_appointments", patient_id=patient.id)
+                form.add_error(None, "This slot is already booked by another patient.")
     else:
         form = AppointmentRequestForm()
 
@@ -353,12 +353,18 @@ def family_adherence_insights(request):
         is_active=True
     ).select_related("patient__user")
 
+    links = list(links)
+    stats_by_patient = get_adherence_stats_bulk(
+        [link.patient.user for link in links],
+        days=7
+    )
+
     patient_adherence = []
     total_taken = total_missed = risk_patients = 0
     percentages = []
 
     for link in links:
-        stats = get_adherence_stats(link.patient.user, days=7)
+        stats = stats_by_patient[link.patient.user_id]
         percent = stats["adherence"] or 0
 
         total_taken += stats["taken"]
@@ -387,4 +393,42 @@ def family_adherence_insights(request):
             "patient_adherence": patient_adherence,
             "missed_logs": [],
         }
-    )
\ No newline at end of file
+    )
+
+
+@role_required("family")
+def family_today_doses(request):
+    """Today's expected doses and their logged status for every dependent."""
+    today = timezone.localdate()
+    links = list(
+        FamilyPatientLink.objects.filter(
+            family_member=request.user,
+            status="approved",
+            is_active=True
+        ).select_related("patient__user").order_by("created_at")
+    )
+
+    today_doses = get_today_doses([link.patient.user_id for link in links], today)
+
+    dependents = []
+    total = taken = 0
+    for link in links:
+        doses = today_doses.get(link.patient.user_id, [])
+        taken_here = sum(1 for dose in doses if dose.status == "taken")
+        total += len(doses)
+        taken += taken_here
+
+        dependents.append({
+            "link": link,
+            "patient_name": link.patient.user.get_full_name() or link.patient.user.username,
+            "doses": doses,
+            "taken": taken_here,
+            "pending": sum(1 for dose in doses if not dose.status),
+        })
+
+    return render(request, "family/today_doses.html", {
+        "today": today,
+        "dependents": dependents,
+        "total_doses": total,
+        "taken_doses": taken,
+    })
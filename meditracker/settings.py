@@ -97,6 +97,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Must be shared by every worker: dashboard counters and doctor
+# availability masks are invalidated through it, so a per-process cache
+# (LocMemCache) leaves other workers serving stale data. The database
+# cache needs no extra service; its table is created after migrate. The
+# trade-off is that a cache hit is still one indexed SELECT on that table
+# (the counter and availability queries themselves are skipped). Point
+# CACHE_BACKEND / CACHE_LOCATION at Redis or Memcached where one is
+# deployed to make hits free of SQL.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='meditracker_cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,109 @@
+import time as time_module
+import tracemalloc
+import uuid
+from datetime import time, timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medicines.models import Medicine, Prescription, PrescriptionItem
+from schedules.models import MedicineSchedule
+from schedules.services import expand_schedule_arrays, get_expected_doses, iter_expected_dose_batches
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark dose expansion over synthetic schedules: the NumPy kernel "
+        "alone, then (with --database) get_expected_doses and the batched "
+        "iterator the missed-dose sweep uses, against throwaway rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schedules", type=int, default=300_000)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--database", action="store_true",
+            help="Also insert the schedules and time the database-backed APIs.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["schedules"]
+        days = options["days"]
+        rng = np.random.default_rng(0)
+
+        today = np.datetime64(timezone.localdate(), "D")
+        starts = today - rng.integers(0, 365, count).astype("timedelta64[D]")
+        ends = starts + rng.integers(7, 400, count).astype("timedelta64[D]")
+        ends[rng.random(count) < 0.3] = np.datetime64("NaT")
+        repeat_daily = rng.random(count) < 0.9
+
+        start_date = timezone.localdate()
+        end_date = start_date + timedelta(days=days - 1)
+
+        timings = []
+        for _ in range(options["repeat"]):
+            began = time_module.perf_counter()
+            source, _dates = expand_schedule_arrays(starts, ends, repeat_daily, start_date, end_date)
+            timings.append(time_module.perf_counter() - began)
+
+        best = min(timings)
+        self.stdout.write(
+            f"{count} schedules x {days} days -> {len(source)} doses; "
+            f"best {best * 1000:.1f} ms ({len(source) / best / 1e6:.1f}M doses/s)"
+        )
+
+        if options["database"]:
+            self.bench_database(starts, ends, repeat_daily, start_date, end_date)
+
+    def bench_database(self, starts, ends, repeat_daily, start_date, end_date):
+        tag = uuid.uuid4().hex[:8]
+        patient = User.objects.create_user(username=f"bench-pat-{tag}", role="patient")
+        medicine = Medicine.objects.create(name=f"bench-{tag}")
+        item = PrescriptionItem.objects.create(
+            prescription=Prescription.objects.create(patient=patient),
+            medicine=medicine,
+            dose="1",
+            frequency="OD",
+        )
+
+        try:
+            MedicineSchedule.objects.bulk_create(
+                (
+                    MedicineSchedule(
+                        prescription_item=item,
+                        start_date=start,
+                        end_date=end,
+                        repeat_daily=repeat,
+                        time=time(8, 0),
+                    )
+                    for start, end, repeat in zip(starts.tolist(), ends.tolist(), repeat_daily.tolist())
+                ),
+                batch_size=5000,
+            )
+
+            for label, run in (
+                ("get_expected_doses", lambda: len(get_expected_doses(start_date, end_date, [patient]))),
+                ("iter_expected_dose_batches", lambda: sum(
+                    len(batch.schedule_ids)
+                    for batch in iter_expected_dose_batches(start_date, end_date, [patient])
+                )),
+            ):
+                tracemalloc.start()
+                began = time_module.perf_counter()
+                doses = run()
+                elapsed = time_module.perf_counter() - began
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{label}: {doses} doses in {elapsed:.2f} s, peak {peak / 2**20:.0f} MiB"
+                )
+        finally:
+            MedicineSchedule.objects.filter(prescription_item=item).delete()
+            patient.delete()
+            medicine.delete()
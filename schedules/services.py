@@ -0,0 +1,123 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .models import MedicineSchedule
+
+PATIENT_LOOKUP = "prescription_item__prescription__patient"
+
+DoseOccurrence = namedtuple("DoseOccurrence", ["schedule_id", "patient_id", "date", "time"])
+DoseBatch = namedtuple("DoseBatch", ["schedule_ids", "patient_ids", "dates", "times", "moments"])
+
+# Schedules loaded and expanded per query by iter_expected_dose_batches
+SCHEDULE_BATCH_SIZE = 5000
+
+
+def expand_schedule_arrays(starts, ends, repeat_daily, start_date, end_date):
+    """
+    Vectorised expansion of schedule date ranges into one entry per dose day.
+
+    `starts` / `ends` are datetime64[D] arrays (NaT end = open-ended) and
+    `repeat_daily` a bool array, one entry per schedule. Non-repeating
+    schedules produce a single dose on their start date.
+
+    Returns (source, dates): for every dose, the index of the schedule it
+    came from and its datetime64[D] date, ordered by schedule then date.
+    """
+    lower = np.datetime64(start_date, "D")
+    upper = np.datetime64(end_date, "D")
+
+    ends = np.where(np.isnat(ends), upper, ends)
+    ends = np.where(repeat_daily, ends, starts)
+
+    first = np.maximum(starts, lower)
+    last = np.minimum(ends, upper)
+
+    counts = (last - first).astype(np.int64) + 1
+    np.clip(counts, 0, None, out=counts)
+
+    source = np.repeat(np.arange(len(counts)), counts)
+    block_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = np.arange(len(source)) - block_starts
+
+    dates = first[source] + offsets.astype("timedelta64[D]")
+    return source, dates
+
+
+def iter_expected_dose_batches(start_date, end_date, patient_users=None, batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Yields the expected doses of active schedules between `start_date`
+    and `end_date` (inclusive) as DoseBatch arrays, `batch_size` schedules
+    at a time (keyset on id), so memory is bounded by the batch however
+    many schedules there are. Optionally limited to `patient_users`.
+
+    Each DoseBatch holds one entry per dose: schedule_ids / patient_ids
+    (int64), dates (datetime64[D]), times (datetime.time objects) and
+    moments (datetime64[s], date + time, naive local time).
+    """
+    schedules = MedicineSchedule.objects.filter(
+        is_active=True,
+        start_date__lte=end_date,
+    ).exclude(
+        end_date__lt=start_date,
+    )
+
+    if patient_users is not None:
+        schedules = schedules.filter(**{f"{PATIENT_LOOKUP}__in": patient_users})
+
+    last_id = 0
+    while True:
+        rows = list(schedules.filter(id__gt=last_id).values_list(
+            "id", f"{PATIENT_LOOKUP}_id", "start_date", "end_date", "repeat_daily", "time"
+        ).order_by("id")[:batch_size])
+
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        ids, patient_ids, starts, ends, repeat_daily, times = zip(*rows)
+
+        source, dates = expand_schedule_arrays(
+            np.array(starts, dtype="datetime64[D]"),
+            np.array(ends, dtype="datetime64[D]"),
+            np.array(repeat_daily, dtype=bool),
+            start_date,
+            end_date,
+        )
+
+        offsets = np.array(
+            [at.hour * 3600 + at.minute * 60 + at.second for at in times],
+            dtype="timedelta64[s]",
+        )
+        time_objects = np.empty(len(times), dtype=object)
+        time_objects[:] = times
+
+        yield DoseBatch(
+            np.array(ids, dtype=np.int64)[source],
+            np.array(patient_ids, dtype=np.int64)[source],
+            dates,
+            time_objects[source],
+            dates.astype("datetime64[s]") + offsets[source],
+        )
+
+        if len(rows) < batch_size:
+            return
+
+
+def get_expected_doses(start_date, end_date, patient_users=None):
+    """
+    Returns every expected dose of active schedules between `start_date`
+    and `end_date` (inclusive) as DoseOccurrence tuples.
+    Optionally limited to `patient_users`. Callers walking every schedule
+    should use iter_expected_dose_batches instead.
+    """
+    return [
+        DoseOccurrence(schedule_id, patient_id, day, at)
+        for batch in iter_expected_dose_batches(start_date, end_date, patient_users)
+        for schedule_id, patient_id, day, at in zip(
+            batch.schedule_ids.tolist(),
+            batch.patient_ids.tolist(),
+            batch.dates.tolist(),
+            batch.times.tolist(),
+        )
+    ]
@@ -1,3 +1,72 @@
+from datetime import date, time
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from medicines.models import Medicine, Prescription, PrescriptionItem
+from .models import MedicineSchedule
+from .services import get_expected_doses, iter_expected_dose_batches
+
+User = get_user_model()
+
+
+class ExpectedDosesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username="pat", password="x", role="patient")
+        medicine = Medicine.objects.create(name="Atorvastatin", strength="10mg")
+        prescription = Prescription.objects.create(patient=cls.patient)
+        cls.item = PrescriptionItem.objects.create(
+            prescription=prescription, medicine=medicine, dose="1", frequency="OD"
+        )
+
+    def schedule(self, **kwargs):
+        kwargs.setdefault("time", time(8, 0))
+        return MedicineSchedule.objects.create(prescription_item=self.item, **kwargs)
+
+    def test_expansion_clips_to_schedule_and_range(self):
+        daily = self.schedule(start_date=date(2026, 3, 1), end_date=date(2026, 3, 3))
+        open_ended = self.schedule(start_date=date(2026, 3, 2), time=time(21, 0))
+        once = self.schedule(start_date=date(2026, 3, 3), repeat_daily=False)
+        self.schedule(start_date=date(2026, 3, 1), is_active=False)
+        self.schedule(start_date=date(2026, 2, 1), end_date=date(2026, 2, 20))
+
+        doses = get_expected_doses(date(2026, 3, 2), date(2026, 3, 4))
+
+        self.assertEqual(
+            [(d.schedule_id, d.date, d.time) for d in doses],
+            [
+                (daily.id, date(2026, 3, 2), time(8, 0)),
+                (daily.id, date(2026, 3, 3), time(8, 0)),
+                (open_ended.id, date(2026, 3, 2), time(21, 0)),
+                (open_ended.id, date(2026, 3, 3), time(21, 0)),
+                (open_ended.id, date(2026, 3, 4), time(21, 0)),
+                (once.id, date(2026, 3, 3), time(8, 0)),
+            ],
+        )
+        self.assertTrue(all(d.patient_id == self.patient.id for d in doses))
+
+    def test_patient_filter(self):
+        self.schedule(start_date=date(2026, 3, 1))
+        other = User.objects.create_user(username="other", password="x", role="patient")
+
+        self.assertEqual(get_expected_doses(date(2026, 3, 1), date(2026, 3, 1), [other]), [])
+        self.assertEqual(len(get_expected_doses(date(2026, 3, 1), date(2026, 3, 1), [self.patient])), 1)
+
+    def test_batches_cover_every_schedule(self):
+        for day in (1, 2, 3):
+            self.schedule(start_date=date(2026, 3, day), time=time(7 + day, 30))
+
+        batches = list(iter_expected_dose_batches(date(2026, 3, 2), date(2026, 3, 3), batch_size=2))
+
+        self.assertEqual([len(batch.schedule_ids) for batch in batches], [4, 1])
+        self.assertEqual(
+            [
+                (schedule_id, day, at)
+                for batch in batches
+                for schedule_id, day, at in zip(batch.schedule_ids.tolist(), batch.dates.tolist(), batch.times.tolist())
+            ],
+            [(d.schedule_id, d.date, d.time) for d in get_expected_doses(date(2026, 3, 2), date(2026, 3, 3))],
+        )
+        self.assertEqual(str(batches[1].moments[0]), "2026-03-03T10:30:00")